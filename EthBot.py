@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # main.py — Tapify Main Bot for Telegram (management 3 patched)
 # Requirements:
-#   pip install python-telegram-bot==20.7 psycopg[binary] python-dotenv flask pydub
+#   pip install python-telegram-bot[job-queue,http2]==21.4 psycopg[binary] python-dotenv flask pydub
 #
 # Environment (.env):
 #   BOT_TOKEN=your_bot_token
@@ -15,41 +15,72 @@
 # Start:
 #   python main.py
 
+import asyncio
+import atexit
+import base64
+import contextlib
 import logging
+import logging.handlers
 import psycopg
 import re
 import time
 import datetime
 import os
+import queue
 import secrets
+import signal
+import sys
+import weakref
+from collections import OrderedDict, deque
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, ReplyKeyboardMarkup, KeyboardButton, WebAppInfo
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
     filters,
     ContextTypes,
 )
-from flask import Flask
-from threading import Thread
+from flask import Flask, Response
+from asgiref.wsgi import WsgiToAsgi
+import uvicorn
+
+try:
+    import uvloop
+except ImportError:  # not available on Windows; fall back to the default loop
+    uvloop = None
 
 # Flask setup for Render keep-alive
 app = Flask('')
+PORT = int(os.getenv("PORT", "8080"))
+
+
+# The keep-alive body never changes, so encode it once at import
+_HOME_BODY = "Tapify is alive!".encode("utf-8")
 
 
 @app.route('/')
 def home():
-    return "Tapify is alive!"
+    return Response(_HOME_BODY, content_type="text/html; charset=utf-8")
 
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+class KeepAliveServer(uvicorn.Server):
+    """uvicorn server that leaves SIGINT/SIGTERM to main_async.
 
+    uvicorn re-raises the signal it caught once serve() returns, which would
+    kill the process before the bot is stopped and its buffers are flushed.
+    """
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+def keep_alive_server():
+    # Served by uvicorn on the bot's own event loop instead of a separate thread
+    config = uvicorn.Config(WsgiToAsgi(app), host='0.0.0.0', port=PORT, log_level="warning")
+    return KeepAliveServer(config)
 
 
 # Bot credentials
@@ -69,6 +100,15 @@ if not ADMIN_ID:
     logging.error("ADMIN_ID is required in environment (.env)")
     raise ValueError("ADMIN_ID is required")
 
+# Package prices in naira (Standard = Lite, X = Pro)
+PACKAGE_PRICES = {"Standard": 10000, "X": 15000}
+
+# Input patterns, compiled once at import
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+PHONE_RE = re.compile(r"\+?\d{10,15}")
+TG_USER_RE = re.compile(r"^@[A-Za-z0-9_]{5,}$")
+TG_LINK_RE = re.compile(r'(@[A-Za-z0-9_]+)|(?:https?://)?(?:www\.)?(?:t\.me|telegram\.(?:me|dog))/([A-Za-z0-9_+]+)')
+
 # Predefined payment accounts
 PAYMENT_ACCOUNTS = {
     "Nigeria (Opay)": "󰐕 Account: 6110749592\nBank: Opay\nName: Chike Eluem Olanrewaju",
@@ -83,6 +123,128 @@ COUPON_PAYMENT_ACCOUNTS = {
     "Coupon Acct 3 (Kuda)": "󰐕 Account: 2036035854\nBank: Kuda Bank\nName: Eluem, Chike Olanrewaju"
 }
 
+# Static keyboards, built once instead of on every callback
+MAIN_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
+HELP_BACK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Help Menu", callback_data="help")]])
+ACCOUNT_SELECTION_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(a, callback_data=f"reg_account_{a}")] for a in PAYMENT_ACCOUNTS]
+    + [[InlineKeyboardButton("Other country option", callback_data="reg_other")],
+       [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]
+)
+COUPON_ACCOUNT_SELECTION_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(a, callback_data=f"coupon_account_{a}")] for a in COUPON_PAYMENT_ACCOUNTS]
+    + [[InlineKeyboardButton("Other country option", callback_data="coupon_other")],
+       [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]
+)
+CHANGE_ACCOUNT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Change Account", callback_data="show_account_selection")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]
+])
+CHANGE_COUPON_ACCOUNT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Change Account", callback_data="show_coupon_account_selection")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]
+])
+PACKAGE_SELECTION_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✈Tapify Lite Package (₦10,000)", callback_data="reg_standard")],
+    [InlineKeyboardButton("🚀Tapify Pro Package (₦15,000)", callback_data="reg_x")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")],
+])
+COUPON_PACKAGE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Lite Package Coupons (₦10,000)", callback_data="coupon_standard")],
+    [InlineKeyboardButton("Pro Package Coupons (₦15,000)", callback_data="coupon_x")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")],
+])
+REMINDER_TOGGLE_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("Toggle Reminder On/Off", callback_data="toggle_reminder")],
+    [InlineKeyboardButton("🔙 Help Menu", callback_data="help")]
+])
+
+# Main menu for unregistered users, registered users, and registered X users (adds AI boost)
+GUEST_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("How It Works", callback_data="how_it_works")],
+    [InlineKeyboardButton("Purchase Coupon Code", callback_data="coupon")],
+    [InlineKeyboardButton("💸 Get Registered Now", callback_data="package_selector")],
+    [InlineKeyboardButton("🚀 Upgrade To Tapify Pro", callback_data="package_selector")],  # upgrade quick button
+    [InlineKeyboardButton("❓ Help", callback_data="help")],
+])
+MEMBER_MENU_ROWS = (
+    (InlineKeyboardButton("📊 My Stats", callback_data="stats"),),
+    (InlineKeyboardButton("Do Daily Tasks", callback_data="daily_tasks"),),
+    (InlineKeyboardButton("💰 Earn Extra for the Day", callback_data="earn_extra"),),
+    (InlineKeyboardButton("Purchase Coupon", callback_data="coupon"),),
+    (InlineKeyboardButton("❓ Help", callback_data="help"),),
+)
+MEMBER_MENU_MARKUP = InlineKeyboardMarkup(MEMBER_MENU_ROWS)
+MEMBER_X_MENU_MARKUP = InlineKeyboardMarkup(
+    MEMBER_MENU_ROWS[:1] + ((InlineKeyboardButton("🚀 Boost with AI", callback_data="boost_ai"),),) + MEMBER_MENU_ROWS[1:]
+)
+# Reply keyboard under the menu; registered users also get a per-chat web app button
+MENU_REPLY_ROW = ("/menu(🔙)",)
+GUEST_REPLY_MARKUP = ReplyKeyboardMarkup((MENU_REPLY_ROW,), resize_keyboard=True)
+
+# Static "How It Works" screen and its voice-note follow-up
+HOW_IT_WORKS_TEXT = (
+    "🍊 HOW TAPIFY WORKS 💥\n\n"
+    "Tapify rewards you for your everyday online actions — walking, gaming, sending snaps, talking to foreigners, joining forums, mining Tap coins, and engaging socially.\n"
+    "Tapify also helps its users to get online or offline jobs.\n"
+    "— — —\n\n"
+    "📍 TAPIFY REGISTRATION PACKAGES\n"
+    "• Tapify Pro: ₦15,000\n"
+    "• Tapify Standard: ₦10,000\n"
+    "— — —\n\n"
+    "🚀 TAPIFY PRO PACKAGE\n"
+    "Earning Structure:\n"
+    "• 🪷 Newbie Bonus: ₦14,000\n"
+    "• 🛜 Freebie: 20GB Preferred Network Data or ₦8,000 Airtime\n"
+    "• 🏦 Tapify Loan: ₦50,000 – ₦1,500,000 with easy payback from your earnings and flexible payment.\n"
+    "• 🏠 Tapify Homes: Verified agents for home hunts provided with 10% cost coverage by Tapify.\n"
+    "• 📺 Ads Earnings: Watch ads and get paid up to $30 daily.\n"
+    "• 🚀 Tapify Boost: 10× faster earning than the Standard Package.\n"
+    "— — —\n\n"
+    "🔥 TAPIFY STANDARD PACKAGE\n"
+    "Earning Structure:\n"
+    "• 🎊 Newbie Bonus: ₦8,000\n"
+    "• 🛜 Freebie: 10GB Preferred Network Data or ₦5,000 Airtime\n"
+    "• 📩 Engage on Forum Topics: ₦200 per engagement\n"
+    "— — —\n\n"
+    "📨🧡 MORE EARNING FEATURES\n"
+    "• 🎥 TikTok or Snapchat Streak: ₦10,000 per streak kept\n"
+    "• 🏍 Rider Earnings: ₦8,000 per delivery\n"
+    "• 🚶‍♂ Step Earnings: ₦10,000 per 100 steps\n"
+    "• 💬 Chat with Foreigners: Earn up to $100 in tips\n"
+    "• 📤 Story Upload: ₦5,000 per approved topic\n"
+    "• 🎙 Recording Earnings: ₦200 per record upload\n"
+    "• 🌐 Daily Social Media Earnings: ₦5,000\n"
+    "— — —\n\n"
+    "💫 ADDITIONAL BENEFITS\n"
+    "• 🏦 Student Loan: No collateral required\n"
+    "• 🪙 Tapify Coin: Free mining for all users\n"
+    "• 📄 Tap Jobs: Tapify helps users find jobs online and offline\n"
+    "— — —\n\n"
+    "💖 ADDITIONAL EARNINGS\n"
+    "• 💰 Revenue Share: ₦13,000 – ₦9,000\n"
+    "• 🔄 Indirect Bonus: ₦500 – ₦250\n"
+    "• 🌀 2nd Indirect Bonus: ₦200 – ₦100\n"
+    "— — —\n\n"
+    "🏦 PAYMENT INFO\n"
+    "• 📆 MONDAYS, WEDNESDAYS, AND FRIDAYS\n\n"
+    "🎓 You’ll also be added to a mentorship class to learn how to make up to ₦300,000 weekly with the opportunities on Tapify after registration.\n"
+    " Ensure to listen to the Voice Note below to understand more about our features..."
+)
+HOW_IT_WORKS_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("💎CLICK TO PROCEED!", callback_data="package_selector")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]
+])
+VOICE_DONE_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("✅ I'm done listening...", callback_data="close_voice")]])
+
+# Refer-a-friend screen; only the bot username and referrer chat_id vary
+REFER_TEXT_TEMPLATE = (
+    "👥 Refer a Friend and Earn Rewards!\n\n"
+    "Share your referral link with friends. For each friend who joins using your link, you earn $0.1. "
+    "If they register, you earn an additional $0.4 for Lite Package or $0.9 for Pro package.\n\n"
+    "Your referral link: https://t.me/{bot_username}?start=ref_{chat_id}"
+)
+
 # Predefined FAQs
 FAQS = {
     "what_is_ethereal": {
@@ -118,6 +280,132 @@ HELP_TOPICS = {
     "password_recovery": {"label": "Password Recovery", "type": "input", "text": "Please provide your registered email to request password recovery:"},
 }
 
+# Button rows for the FAQ and help menus, in display order
+FAQ_ROWS = tuple((InlineKeyboardButton(faq["question"], callback_data=f"faq_{key}"),) for key, faq in FAQS.items())
+HELP_TOPIC_ROWS = tuple((InlineKeyboardButton(topic["label"], callback_data=key),) for key, topic in HELP_TOPICS.items())
+FAQ_MENU_MARKUP = InlineKeyboardMarkup(
+    FAQ_ROWS
+    + ((InlineKeyboardButton("Ask Another Question", callback_data="faq_custom"),),
+       (InlineKeyboardButton("🔙 Help Menu", callback_data="help"),))
+)
+FAQ_ANSWER_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 FAQ Menu", callback_data="faq"), InlineKeyboardButton("🔙 Help Menu", callback_data="help")]])
+# Help menu, with "Refer a Friend" shown only to registered users
+HELP_MENU_MARKUP = InlineKeyboardMarkup(
+    HELP_TOPIC_ROWS + ((InlineKeyboardButton("🔙 Main Menu", callback_data="menu"),),)
+)
+HELP_MENU_REGISTERED_MARKUP = InlineKeyboardMarkup(
+    HELP_TOPIC_ROWS
+    + ((InlineKeyboardButton("👥 Refer a Friend", callback_data="refer_friend"),),
+       (InlineKeyboardButton("🔙 Main Menu", callback_data="menu"),))
+)
+
+# Schema, created at startup in one pipelined batch
+DDL_STATEMENTS = (
+    # Users table
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        chat_id BIGINT PRIMARY KEY,
+        package TEXT,
+        payment_status TEXT DEFAULT 'new',
+        name TEXT,
+        username TEXT,
+        email TEXT,
+        phone TEXT,
+        password TEXT,
+        join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        alarm_setting INTEGER DEFAULT 0,
+        streaks INTEGER DEFAULT 0,
+        invites INTEGER DEFAULT 0,
+        balance REAL DEFAULT 0,
+        screenshot_uploaded_at TIMESTAMP,
+        approved_at TIMESTAMP,
+        registration_date TIMESTAMP,
+        referral_code TEXT,
+        referred_by BIGINT
+    )
+    """,
+    # Registered-user revenue in daily_summary filters on this exact predicate
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_registered_approved_at ON users (approved_at) WHERE payment_status = 'registered'
+    """,
+    # daily_reminder reads only the users who opted in
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_alarm_chat_id ON users (chat_id) WHERE alarm_setting = 1
+    """,
+    # Payments table (now includes is_upgrade)
+    """
+    CREATE TABLE IF NOT EXISTS payments (
+        id SERIAL PRIMARY KEY,
+        chat_id BIGINT,
+        type TEXT,
+        package TEXT,
+        quantity INTEGER,
+        total_amount INTEGER,
+        payment_account TEXT,
+        is_upgrade BOOLEAN DEFAULT FALSE,
+        status TEXT DEFAULT 'pending_payment',
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        approved_at TIMESTAMP,
+        screenshot_uploaded_at TIMESTAMP
+    )
+    """,
+    # Older deployments created payments without screenshot_uploaded_at
+    """
+    ALTER TABLE payments ADD COLUMN IF NOT EXISTS screenshot_uploaded_at TIMESTAMP
+    """,
+    # The payment follow-up sweep scans recent screenshot uploads
+    """
+    CREATE INDEX IF NOT EXISTS idx_users_screenshot_uploaded_at ON users (screenshot_uploaded_at)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_payments_screenshot_uploaded_at ON payments (screenshot_uploaded_at)
+    """,
+    # Coupons table
+    """
+    CREATE TABLE IF NOT EXISTS coupons (
+        id SERIAL PRIMARY KEY,
+        payment_id INTEGER,
+        code TEXT,
+        FOREIGN KEY (payment_id) REFERENCES payments(id)
+    )
+    """,
+    # Interactions table
+    """
+    CREATE TABLE IF NOT EXISTS interactions (
+        id SERIAL PRIMARY KEY,
+        chat_id BIGINT,
+        action TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # Tasks table
+    """
+    CREATE TABLE IF NOT EXISTS tasks (
+        id SERIAL PRIMARY KEY,
+        type TEXT,
+        link TEXT,
+        reward REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP
+    )
+    """,
+    # Active-task lookups in earn_extra filter on expires_at
+    """
+    CREATE INDEX IF NOT EXISTS idx_tasks_expires_at ON tasks (expires_at) WHERE expires_at IS NOT NULL
+    """,
+    # User_tasks table
+    """
+    CREATE TABLE IF NOT EXISTS user_tasks (
+        user_id BIGINT,
+        task_id INTEGER,
+        completed_at TIMESTAMP,
+        PRIMARY KEY (user_id, task_id),
+        FOREIGN KEY (user_id) REFERENCES users(chat_id),
+        FOREIGN KEY (task_id) REFERENCES tasks(id)
+    )
+    """,
+)
+
 # Database setup with PostgreSQL
 try:
     import urllib.parse as urlparse
@@ -130,138 +418,283 @@ try:
             url += "&sslmode=require"
         else:
             url += "?sslmode=require"
-    conn = psycopg.connect(url, row_factory=psycopg.rows.dict_row)
-    conn.autocommit = True
+    # The connection lives for the whole process, so server-side prepared
+    # plans for the hot point queries are reused from the second execution on
+    # Autocommit: each single-statement write is sent on its own, with no BEGIN/COMMIT around it
+    conn = psycopg.connect(url, autocommit=True, row_factory=psycopg.rows.dict_row, prepare_threshold=2)
     cursor = conn.cursor()
+    # For hot lookups that read columns positionally; skips building a dict per row
+    tuple_cursor = conn.cursor(row_factory=psycopg.rows.tuple_row)
 
-    # Users table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            chat_id BIGINT PRIMARY KEY,
-            package TEXT,
-            payment_status TEXT DEFAULT 'new',
-            name TEXT,
-            username TEXT,
-            email TEXT,
-            phone TEXT,
-            password TEXT,
-            join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            alarm_setting INTEGER DEFAULT 0,
-            streaks INTEGER DEFAULT 0,
-            invites INTEGER DEFAULT 0,
-            balance REAL DEFAULT 0,
-            screenshot_uploaded_at TIMESTAMP,
-            approved_at TIMESTAMP,
-            registration_date TIMESTAMP,
-            referral_code TEXT,
-            referred_by BIGINT
-        )
-    """)
-
-    # Payments table (now includes is_upgrade)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS payments (
-            id SERIAL PRIMARY KEY,
-            chat_id BIGINT,
-            type TEXT,
-            package TEXT,
-            quantity INTEGER,
-            total_amount INTEGER,
-            payment_account TEXT,
-            is_upgrade BOOLEAN DEFAULT FALSE,
-            status TEXT DEFAULT 'pending_payment',
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            approved_at TIMESTAMP
-        )
-    """)
-
-    # Coupons table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS coupons (
-            id SERIAL PRIMARY KEY,
-            payment_id INTEGER,
-            code TEXT,
-            FOREIGN KEY (payment_id) REFERENCES payments(id)
-        )
-    """)
-
-    # Interactions table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS interactions (
-            id SERIAL PRIMARY KEY,
-            chat_id BIGINT,
-            action TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    # Tasks table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id SERIAL PRIMARY KEY,
-            type TEXT,
-            link TEXT,
-            reward REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP
-        )
-    """)
-
-    # User_tasks table
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_tasks (
-            user_id BIGINT,
-            task_id INTEGER,
-            completed_at TIMESTAMP,
-            PRIMARY KEY (user_id, task_id),
-            FOREIGN KEY (user_id) REFERENCES users(chat_id),
-            FOREIGN KEY (task_id) REFERENCES tasks(id)
-        )
-    """)
+    with conn.pipeline():
+        for statement in DDL_STATEMENTS:
+            cursor.execute(statement)
 except psycopg.Error as e:
-    logging.error(f"Database error: {e}")
+    logging.error("Database error: %s", e)
     raise
 
 # In-memory storage
-user_state = {}
+class TTLState:
+    """Per-chat conversation state that forgets chats idle for longer than ``ttl`` seconds.
+
+    Supports the dict operations the handlers use. Entries are kept in
+    least-recently-touched order, so expiry only walks the stale head.
+    """
+    __slots__ = ("_data", "ttl", "maxsize")
+
+    def __init__(self, ttl, maxsize):
+        self._data = OrderedDict()  # chat_id -> [state, last_touched]
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+    def __getitem__(self, chat_id):
+        entry = self._data[chat_id]
+        entry[1] = time.monotonic()
+        self._data.move_to_end(chat_id)
+        return entry[0]
+
+    def __setitem__(self, chat_id, state):
+        self._data[chat_id] = [state, time.monotonic()]
+        self._data.move_to_end(chat_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __delitem__(self, chat_id):
+        del self._data[chat_id]
+
+    def __contains__(self, chat_id):
+        return chat_id in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, chat_id, default=None):
+        if chat_id in self._data:
+            return self[chat_id]
+        return default
+
+    def pop(self, chat_id, default=None):
+        entry = self._data.pop(chat_id, None)
+        return default if entry is None else entry[0]
+
+    def setdefault(self, chat_id, default):
+        if chat_id not in self._data:
+            self[chat_id] = default
+        return self[chat_id]
+
+    def evict_expired(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._data:
+            chat_id, (_, last_touched) = next(iter(self._data.items()))
+            if last_touched >= cutoff:
+                break
+            del self._data[chat_id]
+
+
+class TokenBucket:
+    """Async rate limiter: at most ``rate`` acquisitions per ``per`` seconds.
+
+    Tokens refill continuously, so a full bucket allows a burst of ``rate``
+    and callers then proceed at the steady rate.
+    """
+    __slots__ = ("rate", "per", "_tokens", "_updated", "_lock")
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates concurrently, except that updates from the same chat run in arrival order.
+
+    A slow handler for one chat no longer holds up every other chat, while a
+    chat's own multi-step flow in ``user_state`` still sees its messages in order.
+    The concurrency limit only counts updates that hold their chat's lock, so
+    updates queued behind a busy chat do not use up slots other chats need.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # The base class takes its semaphore before do_process_update waits on
+        # the chat lock, so leave that one unbounded and limit running updates here
+        super().__init__(sys.maxsize)
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = weakref.WeakValueDictionary()  # chat_id -> asyncio.Lock while in use
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._running:
+                await coroutine
+            return
+        lock = self._locks.get(chat.id)
+        if lock is None:
+            lock = self._locks[chat.id] = asyncio.Lock()
+        async with lock:
+            async with self._running:
+                await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+# Flows idle for a day are dropped; covers the one-hour payment follow-up
+user_state = TTLState(ttl=86400, maxsize=50000)
+# chat_id -> whether the reply keyboard last sent was the registered variant.
+# Telegram keeps a reply keyboard until it is replaced, so menus only resend it on change
+reply_keyboard_shown = TTLState(ttl=86400, maxsize=50000)
+# chat_id -> ((payment_status, package), cached_at); saves a SELECT on most callbacks
+status_cache = {}
+STATUS_CACHE_TTL = 30
+# Interaction rows waiting to be COPYed into the interactions table
+pending_interactions = []
+INTERACTION_FLUSH_SIZE = 500
+# Rows kept for retry while the database is unreachable; the oldest are dropped beyond this
+INTERACTION_BACKLOG_MAX = 10 * INTERACTION_FLUSH_SIZE
+# Shared by bulk sends so they stay under Telegram's ~30 messages/second limit
+send_bucket = TokenBucket(30, 1.0)
+BROADCAST_BATCH = 200
+# (chat, user_id) -> (member status, cached_at) for task verification. Non-members
+# expire sooner so a genuine join is picked up within seconds
+member_cache = {}
+MEMBER_STATUSES = ("member", "administrator", "creator")
+MEMBER_CACHE_TTL = 30
+MEMBER_CACHE_NEGATIVE_TTL = 5
+# Users hear back once their payment screenshot has waited this long for review
+PAYMENT_FOLLOW_UP_DELAY = datetime.timedelta(hours=1)
+PAYMENT_SWEEP_INTERVAL = 300
+# Telegram file_id of voice.ogg, set after the first upload so repeats skip it
+voice_file_id = None
+# Referral codes drawn from one urandom read per REFERRAL_BATCH users
+referral_pool = deque()
+REFERRAL_BATCH = 256
+REFERRAL_BYTES = 6
 start_time = time.time()
 
-# Logging
-logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-                    level=logging.INFO)
+# Logging: handlers only enqueue records; a listener thread does the
+# formatting and stream writes so the event loop never blocks on stdout.
+log_queue = queue.SimpleQueue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+root_logger = logging.getLogger()
+root_logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+root_logger.setLevel(logging.INFO)
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 
 # Helper functions
-def get_status(chat_id):
+def get_user_brief(chat_id):
+    """Return (payment_status, package) for chat_id; (None, None) if unknown."""
+    cached = status_cache.get(chat_id)
+    if cached and time.monotonic() - cached[1] < STATUS_CACHE_TTL:
+        return cached[0]
     try:
-        cursor.execute("SELECT payment_status FROM users WHERE chat_id=%s", (chat_id,))
-        row = cursor.fetchone()
-        return row["payment_status"] if row else None
+        tuple_cursor.execute("SELECT payment_status, package FROM users WHERE chat_id=%s", (chat_id,), prepare=True)
+        row = tuple_cursor.fetchone()
     except psycopg.Error as e:
-        logger.error(f"Database error in get_status: {e}")
-        return None
+        logger.error("Database error in get_user_brief: %s", e)
+        return None, None
+    brief = row or (None, None)
+    status_cache[chat_id] = (brief, time.monotonic())
+    return brief
+
+
+def get_status(chat_id):
+    return get_user_brief(chat_id)[0]
+
+
+def invalidate_status(chat_id):
+    # Call after any write to users.payment_status or package (or a new users row)
+    status_cache.pop(chat_id, None)
 
 
 def is_registered(chat_id):
-    try:
-        cursor.execute("SELECT payment_status FROM users WHERE chat_id=%s", (chat_id,))
-        row = cursor.fetchone()
-        return row and row["payment_status"] == 'registered'
-    except psycopg.Error as e:
-        logger.error(f"Database error in is_registered {chat_id}: {e}")
-        return False
+    return get_status(chat_id) == 'registered'
 
 
 def log_interaction(chat_id, action):
+    # Buffered; written in bulk by write_interactions()
+    pending_interactions.append((chat_id, action, datetime.datetime.now()))
+    # == rather than >=: after a failed flush the requeued backlog is retried by
+    # the periodic job instead of on every new interaction
+    if len(pending_interactions) == INTERACTION_FLUSH_SIZE:
+        write_interactions()
+
+
+def write_interactions():
+    if not pending_interactions:
+        return
+    batch = pending_interactions[:]
+    pending_interactions.clear()
     try:
-        cursor.execute("INSERT INTO interactions (chat_id, action) VALUES (%s, %s)", (chat_id, action))
+        with cursor.copy("COPY interactions (chat_id, action, timestamp) FROM STDIN") as copy:
+            for row in batch:
+                copy.write_row(row)
     except psycopg.Error as e:
-        logger.error(f"Database error in log_interaction: {e}")
+        logger.error("Database error in write_interactions: %s", e)
+        # Put the batch back in front of anything logged since, for the next flush
+        pending_interactions[:0] = batch
+        dropped = len(pending_interactions) - INTERACTION_BACKLOG_MAX
+        if dropped > 0:
+            del pending_interactions[:dropped]
+            logger.error("Dropped %s oldest buffered interactions", dropped)
+
+
+async def get_member_status(bot, chat, user_id):
+    # Repeat Verify presses reuse a recent answer instead of calling getChatMember again
+    key = (chat, user_id)
+    cached = member_cache.get(key)
+    if cached and time.monotonic() - cached[1] < (MEMBER_CACHE_TTL if cached[0] in MEMBER_STATUSES else MEMBER_CACHE_NEGATIVE_TTL):
+        return cached[0]
+    member = await bot.get_chat_member(chat, user_id)
+    member_cache[key] = (member.status, time.monotonic())
+    return member.status
+
+
+def award_task(user_id, task_id):
+    # Records the completion and credits the task's reward in one round trip; returns the reward
+    tuple_cursor.execute("""
+        WITH done AS (
+            INSERT INTO user_tasks (user_id, task_id, completed_at) VALUES (%s, %s, %s)
+            RETURNING task_id
+        )
+        UPDATE users SET balance = balance + t.reward
+        FROM done JOIN tasks t ON t.id = done.task_id
+        WHERE users.chat_id = %s
+        RETURNING t.reward
+    """, (user_id, task_id, datetime.datetime.now(), user_id), prepare=True)
+    return tuple_cursor.fetchone()[0]
 
 
 def generate_referral_code():
-    return secrets.token_urlsafe(6)
+    if not referral_pool:
+        raw = os.urandom(REFERRAL_BYTES * REFERRAL_BATCH)
+        referral_pool.extend(
+            base64.urlsafe_b64encode(raw[i:i + REFERRAL_BYTES]).decode("ascii")
+            for i in range(0, len(raw), REFERRAL_BYTES)
+        )
+    return referral_pool.popleft()
 
 
 # Command handlers
@@ -272,20 +705,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     referred_by = None
     if args and args[0].startswith("ref_"):
         try:
-            referred_by = int(args[0].split("_")[1])
+            referred_by = int(args[0][len("ref_"):])
         except (IndexError, ValueError):
             pass
     log_interaction(chat_id, "start")
+    # A fresh /start resends the reply keyboard with the next menu
+    reply_keyboard_shown.pop(chat_id)
     try:
-        cursor.execute("SELECT payment_status FROM users WHERE chat_id=%s", (chat_id,))
-        if not cursor.fetchone():
-            cursor.execute(
-                "INSERT INTO users (chat_id, username, referral_code, referred_by) VALUES (%s, %s, %s, %s)",
-                (chat_id, update.effective_user.username or "Unknown", referral_code, referred_by)
-            )
+        # Existence check and insert in one statement; a row comes back only for new users
+        cursor.execute(
+            "INSERT INTO users (chat_id, username, referral_code, referred_by) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (chat_id) DO NOTHING RETURNING chat_id",
+            (chat_id, update.effective_user.username or "Unknown", referral_code, referred_by)
+        )
+        if cursor.fetchone():
             if referred_by:
                 cursor.execute("UPDATE users SET invites = invites + 1, balance = balance + 0.1 WHERE chat_id=%s", (referred_by,))
-            conn.commit()
+            invalidate_status(chat_id)
         keyboard = [[InlineKeyboardButton("🚀 Get Started", callback_data="menu")]]
         await update.message.reply_text(
             "Welcome to Tapify!\n\n"
@@ -301,10 +737,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if is_registered(chat_id):
             reply_keyboard.append([KeyboardButton(text="Play Tapify", web_app=WebAppInfo(url=f"{WEBAPP_URL}/?chat_id={chat_id}"))])
     except psycopg.Error as e:
-        logger.error(f"Database error in start: {e}")
+        logger.error("Database error in start: %s", e)
         await update.message.reply_text("An error occurred while accessing the database. Please try again later.")
     except Exception as e:
-        logger.error(f"Unexpected error in start: {e}")
+        logger.error("Unexpected error in start: %s", e)
         await update.message.reply_text("An unexpected error occurred. Please try again or contact @bigscottmedia.")
 
 
@@ -323,6 +759,7 @@ async def cmd_game(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Tap to earn coins!",
         reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True)
     )
+    reply_keyboard_shown.pop(chat_id)
 
 
 async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -336,15 +773,15 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     log_interaction(chat_id, "stats")
     try:
-        cursor.execute("SELECT payment_status, streaks, invites, package, balance FROM users WHERE chat_id=%s", (chat_id,))
-        user = cursor.fetchone()
+        tuple_cursor.execute("SELECT payment_status, streaks, invites, package, balance FROM users WHERE chat_id=%s", (chat_id,), prepare=True)
+        user = tuple_cursor.fetchone()
         if not user:
             if update.callback_query:
                 await update.callback_query.answer("No user data found. Please start with /start.")
             else:
                 await update.message.reply_text("No user data found. Please start with /start.")
             return
-        payment_status, streaks, invites, package, balance = user.values()
+        payment_status, streaks, invites, package, balance = user
         text = (
             "📊 Your Platform Stats:\n\n"
             f"• Package: {package or 'Not selected'}\n"
@@ -362,7 +799,7 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
     except psycopg.Error as e:
-        logger.error(f"Database error in stats: {e}")
+        logger.error("Database error in stats: %s", e)
         await update.message.reply_text("An error occurred. Please try again.")
 
 
@@ -396,11 +833,10 @@ async def add_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "INSERT INTO tasks (type, link, reward, created_at, expires_at) VALUES (%s, %s, %s, %s, %s)",
             (task_type, link, reward, created_at, expires_at)
         )
-        conn.commit()
         await update.message.reply_text("Task added successfully.")
         log_interaction(chat_id, "add_task")
     except psycopg.Error as e:
-        logger.error(f"Database error in add_task: {e}")
+        logger.error("Database error in add_task: %s", e)
         await update.message.reply_text("An error occurred. Please try again.")
 
 
@@ -415,621 +851,708 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Callback handlers
-async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def _on_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.from_user.id
+    if chat_id in user_state:
+        del user_state[chat_id]
+    await show_main_menu(update, context)
+
+
+async def _on_refer_friend(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    data = query.data
     chat_id = query.from_user.id
-    logger.info(f"Received callback data: {data} from chat_id: {chat_id}")
-    await query.answer()
-    log_interaction(chat_id, f"button_{data}")
+    text = REFER_TEXT_TEMPLATE.format(bot_username=context.bot.username, chat_id=chat_id)
+    await query.edit_message_text(text, reply_markup=HELP_BACK_MARKUP)
+
+
+async def _on_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    tuple_cursor.execute("SELECT balance FROM users WHERE chat_id=%s", (chat_id,), prepare=True)
+    balance = tuple_cursor.fetchone()[0]
+    if balance < 30:
+        await query.answer("Your balance is less than $30.")
+        return
+    await context.bot.send_message(
+        ADMIN_ID,
+        f"Withdrawal request from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id})\n"
+        f"Amount: ${balance}"
+    )
+    await query.edit_message_text(
+        "Your withdrawal request has been sent to the admin. Please wait for processing.",
+        reply_markup=MAIN_MENU_MARKUP
+    )
+
 
+async def _on_how_it_works(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global voice_file_id
+    query = update.callback_query
+    await query.edit_message_text(HOW_IT_WORKS_TEXT, reply_markup=HOW_IT_WORKS_MARKUP)
     try:
-        if data == "menu":
-            if chat_id in user_state:
-                del user_state[chat_id]
-            await show_main_menu(update, context)
-
-        elif data == "stats":
-            await stats(update, context)
-
-        elif data == "refer_friend":
-            cursor.execute("SELECT referral_code FROM users WHERE chat_id=%s", (chat_id,))
-            row = cursor.fetchone()
-            referral_code = row["referral_code"] if row else ""
-            referral_link = f"https://t.me/{context.bot.username}?start=ref_{chat_id}"
-            text = (
-                "👥 Refer a Friend and Earn Rewards!\n\n"
-                "Share your referral link with friends. For each friend who joins using your link, you earn $0.1. "
-                "If they register, you earn an additional $0.4 for Lite Package or $0.9 for Pro package.\n\n"
-                f"Your referral link: {referral_link}"
+        if voice_file_id:
+            await context.bot.send_voice(
+                chat_id=query.message.chat_id,
+                voice=voice_file_id,
+                caption="Tapify Explained 🎧",
+                reply_markup=VOICE_DONE_MARKUP
+            )
+            return
+        with open("voice.ogg", "rb") as voice:
+            message = await context.bot.send_voice(
+                chat_id=query.message.chat_id,
+                voice=voice,
+                caption="Tapify Explained 🎧",
+                reply_markup=VOICE_DONE_MARKUP
             )
-            await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Help Menu", callback_data="help")]]))
+        voice_file_id = message.voice.file_id
+    except FileNotFoundError:
+        logger.error("Voice file 'voice.ogg' not found")
+        await context.bot.send_message(
+            chat_id=query.message.chat_id,
+            text="Error: Voice note file not found. Please contact support.",
+            reply_markup=VOICE_DONE_MARKUP
+        )
+    except Exception as e:
+        logger.error("Error sending voice note: %s", e)
+        await context.bot.send_message(
+            chat_id=query.message.chat_id,
+            text="An error occurred while sending the voice note. Please try again.",
+            reply_markup=VOICE_DONE_MARKUP
+        )
 
-        elif data == "withdraw":
-            cursor.execute("SELECT balance FROM users WHERE chat_id=%s", (chat_id,))
-            balance = cursor.fetchone()["balance"]
-            if balance < 30:
-                await query.answer("Your balance is less than $30.")
-                return
-            await context.bot.send_message(
-                ADMIN_ID,
-                f"Withdrawal request from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id})\n"
-                f"Amount: ${balance}"
+
+async def _on_close_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.message.delete()
+
+
+async def _on_coupon(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    user_state[chat_id] = {'expecting': 'coupon_quantity'}
+    await query.edit_message_text(
+        "How many coupons do you want to purchase?",
+        reply_markup=MAIN_MENU_MARKUP
+    )
+
+
+# Coupon package selection: now supports Standard and X
+async def _on_coupon_package(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    data = query.data
+    package = "Standard" if data == "coupon_standard" else "X"
+    state = user_state.get(chat_id, {})
+    quantity = state.get('coupon_quantity')
+    if not quantity:
+        await query.edit_message_text("Quantity not found. Please start coupon purchase again.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    total = quantity * PACKAGE_PRICES[package]
+    state['coupon_package'] = package
+    state['coupon_total'] = total
+
+    await context.bot.send_message(
+        ADMIN_ID,
+        f"User @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id}) wants to purchase {quantity} {package} coupons for ₦{total}."
+    )
+
+    await query.edit_message_text(
+        f"You are purchasing {quantity} {package} coupons.\nTotal amount: ₦{total}\n\nSelect the account to pay to:",
+        reply_markup=COUPON_ACCOUNT_SELECTION_MARKUP
+    )
+
+
+async def _on_coupon_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    data = query.data
+    account = data[len("coupon_account_"):]
+    payment_details = COUPON_PAYMENT_ACCOUNTS.get(account)
+    if not payment_details:
+        await context.bot.send_message(chat_id, "Error: Invalid account. Contact @bigscottmedia.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    user_state.setdefault(chat_id, {})
+    user_state[chat_id]['selected_account'] = account
+    user_state[chat_id]['expecting'] = 'coupon_screenshot'
+    package = user_state[chat_id].get('coupon_package')
+    quantity = user_state[chat_id].get('coupon_quantity')
+    total = user_state[chat_id].get('coupon_total')
+    # Insert a payment row for coupon purchase (is_upgrade False)
+    try:
+        tuple_cursor.execute(
+            "INSERT INTO payments (chat_id, type, package, quantity, total_amount, payment_account, is_upgrade, status) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
+            (chat_id, 'coupon', package, quantity, total, account, False, 'pending_payment')
+        )
+        payment_id = tuple_cursor.fetchone()[0]
+        user_state[chat_id]['waiting_approval'] = {'type': 'coupon', 'payment_id': payment_id}
+        await context.bot.send_message(
+            chat_id,
+            f"Payment details:\n\n{payment_details}\n\nPlease make the payment and send the screenshot.",
+            reply_markup=CHANGE_COUPON_ACCOUNT_MARKUP
+        )
+    except psycopg.Error as e:
+        logger.error("Database error creating coupon payment: %s", e)
+        await query.edit_message_text("An error occurred creating payment. Please try again.")
+
+
+async def _on_show_coupon_account_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text("Select an account to pay to:", reply_markup=COUPON_ACCOUNT_SELECTION_MARKUP)
+
+
+async def _on_coupon_other(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.from_user.id
+    await context.bot.send_message(
+        chat_id,
+        "Please contact @bigscottmedia to complete your payment for other region coupon purchase.",
+        reply_markup=MAIN_MENU_MARKUP
+    )
+
+
+async def _on_package_selector(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    status = get_status(chat_id)
+    if status == 'registered':
+        await context.bot.send_message(chat_id, "You are already registered.")
+        return
+    await query.edit_message_text("Choose your package:", reply_markup=PACKAGE_SELECTION_MARKUP)
+
+
+async def _on_reg_package(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    data = query.data
+    package = "Standard" if data == "reg_standard" else "X"
+    # Mark upgrade True for X
+    user_state[chat_id] = {'package': package, 'upgrade': True if package == "X" else False}
+    try:
+        cursor.execute("UPDATE users SET package=%s, payment_status='pending_payment' WHERE chat_id=%s", (package, chat_id))
+        if cursor.rowcount == 0:
+            cursor.execute("INSERT INTO users (chat_id, package, payment_status, username) VALUES (%s, %s, 'pending_payment', %s)", (chat_id, package, update.effective_user.username or "Unknown"))
+        invalidate_status(chat_id)
+        await query.edit_message_text("Select an account to pay to:", reply_markup=ACCOUNT_SELECTION_MARKUP)
+    except psycopg.Error as e:
+        logger.error("Database error in package_selector: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
+        return
+
+
+async def _on_reg_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.from_user.id
+    data = update.callback_query.data
+    account = data[len("reg_account_"):]
+    payment_details = PAYMENT_ACCOUNTS.get(account)
+    if not payment_details:
+        await context.bot.send_message(chat_id, "Error: Invalid account. Contact @bigscottmedia.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    # set selected account and expecting screenshot
+    user_state.setdefault(chat_id, {})
+    user_state[chat_id]['selected_account'] = account
+    user_state[chat_id]['expecting'] = 'reg_screenshot'
+    # include package + upgrade marker in waiting_approval for clarity
+    user_state[chat_id]['waiting_approval'] = {'type': 'registration', 'package': user_state[chat_id].get('package'), 'is_upgrade': user_state[chat_id].get('upgrade', False)}
+    await context.bot.send_message(
+        chat_id,
+        f"Payment details:\n\n{payment_details}\n\nPlease make the payment and send the screenshot.",
+        reply_markup=CHANGE_ACCOUNT_MARKUP
+    )
+    # Optional: alert admin that a registration payment flow started (with upgrade tag)
+    try:
+        upgrade_tag = " --Upgrade" if user_state[chat_id].get('upgrade') else ""
+        await context.bot.send_message(ADMIN_ID, f"User @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id}) started registration for {user_state[chat_id].get('package')}{upgrade_tag}. Waiting for screenshot.")
+    except Exception:
+        pass
+
+
+async def _on_show_account_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    package = user_state.get(chat_id, {}).get('package', '')
+    if not package:
+        await query.edit_message_text("Please select a package first.", reply_markup=MAIN_MENU_MARKUP)
+        return
+    await query.edit_message_text("Select an account to pay to:", reply_markup=ACCOUNT_SELECTION_MARKUP)
+
+
+async def _on_reg_other(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.from_user.id
+    await context.bot.send_message(
+        chat_id,
+        "Please contact @bigscottmedia to complete your payment for other region registration.",
+        reply_markup=MAIN_MENU_MARKUP
+    )
+
+
+async def notify_user_and_edit(context, query, user_chat_id, user_text, done_text, unreached_text):
+    """Message the user while editing the admin's message to ``done_text``.
+
+    Both calls run concurrently. If the user can't be reached (e.g. they
+    blocked the bot) the admin message is corrected to ``unreached_text``,
+    so it still reflects the write that already happened.
+    """
+    sent, edited = await asyncio.gather(
+        context.bot.send_message(user_chat_id, user_text),
+        query.edit_message_text(done_text),
+        return_exceptions=True
+    )
+    if isinstance(edited, Exception):
+        raise edited
+    if isinstance(sent, Exception):
+        logger.warning("Could not notify %s: %s", user_chat_id, sent)
+        await query.edit_message_text(unreached_text)
+
+
+# Approve handlers
+async def _on_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    # approve_<kind>_<id>[_<chat_id>]
+    kind, _, ids = query.data.partition("_")[2].partition("_")
+    if kind == "reg":
+        user_chat_id = int(ids)
+        try:
+            cursor.execute("UPDATE users SET payment_status='pending_details', approved_at=%s WHERE chat_id=%s", (datetime.datetime.now(), user_chat_id))
+            invalidate_status(user_chat_id)
+            user_state[user_chat_id] = {'expecting': 'name'}
+            await notify_user_and_edit(
+                context, query, user_chat_id,
+                "✅ Your payment is approved!\n\nPlease provide your full name:",
+                "Payment approved. Waiting for user details.",
+                "Payment approved, but the user could not be notified."
             )
-            await query.edit_message_text(
-                "Your withdrawal request has been sent to the admin. Please wait for processing.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
+        except psycopg.Error as e:
+            logger.error("Database error in approve_reg: %s", e)
+            await query.edit_message_text("An error occurred. Please try again.")
+    elif kind == "coupon":
+        payment_id = int(ids)
+        try:
+            cursor.execute("UPDATE payments SET status='approved', approved_at=%s WHERE id=%s", (datetime.datetime.now(), payment_id))
+            user_state[ADMIN_ID] = {'expecting': {'type': 'coupon_codes', 'payment_id': payment_id}}
+            await asyncio.gather(
+                context.bot.send_message(ADMIN_ID, f"Payment {payment_id} approved. Please send the coupon codes (one per line)."),
+                query.edit_message_text("Payment approved. Waiting for coupon codes.")
             )
-
-        elif data == "how_it_works":
-            keyboard = [
-                [InlineKeyboardButton("💎CLICK TO PROCEED!", callback_data="package_selector")],
-                [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]
-            ]
-            await query.edit_message_text(
-                "🍊 HOW TAPIFY WORKS 💥\n\n"
-                "Tapify rewards you for your everyday online actions — walking, gaming, sending snaps, talking to foreigners, joining forums, mining Tap coins, and engaging socially.\n"
-                "Tapify also helps its users to get online or offline jobs.\n"
-                "— — —\n\n"
-                "📍 TAPIFY REGISTRATION PACKAGES\n"
-                "• Tapify Pro: ₦15,000\n"
-                "• Tapify Standard: ₦10,000\n"
-                "— — —\n\n"
-                "🚀 TAPIFY PRO PACKAGE\n"
-                "Earning Structure:\n"
-                "• 🪷 Newbie Bonus: ₦14,000\n"
-                "• 🛜 Freebie: 20GB Preferred Network Data or ₦8,000 Airtime\n"
-                "• 🏦 Tapify Loan: ₦50,000 – ₦1,500,000 with easy payback from your earnings and flexible payment.\n"
-                "• 🏠 Tapify Homes: Verified agents for home hunts provided with 10% cost coverage by Tapify.\n"
-                "• 📺 Ads Earnings: Watch ads and get paid up to $30 daily.\n"
-                "• 🚀 Tapify Boost: 10× faster earning than the Standard Package.\n"
-                "— — —\n\n"
-                "🔥 TAPIFY STANDARD PACKAGE\n"
-                "Earning Structure:\n"
-                "• 🎊 Newbie Bonus: ₦8,000\n"
-                "• 🛜 Freebie: 10GB Preferred Network Data or ₦5,000 Airtime\n"
-                "• 📩 Engage on Forum Topics: ₦200 per engagement\n"
-                "— — —\n\n"
-                "📨🧡 MORE EARNING FEATURES\n"
-                "• 🎥 TikTok or Snapchat Streak: ₦10,000 per streak kept\n"
-                "• 🏍 Rider Earnings: ₦8,000 per delivery\n"
-                "• 🚶‍♂ Step Earnings: ₦10,000 per 100 steps\n"
-                "• 💬 Chat with Foreigners: Earn up to $100 in tips\n"
-                "• 📤 Story Upload: ₦5,000 per approved topic\n"
-                "• 🎙 Recording Earnings: ₦200 per record upload\n"
-                "• 🌐 Daily Social Media Earnings: ₦5,000\n"
-                "— — —\n\n"
-                "💫 ADDITIONAL BENEFITS\n"
-                "• 🏦 Student Loan: No collateral required\n"
-                "• 🪙 Tapify Coin: Free mining for all users\n"
-                "• 📄 Tap Jobs: Tapify helps users find jobs online and offline\n"
-                "— — —\n\n"
-                "💖 ADDITIONAL EARNINGS\n"
-                "• 💰 Revenue Share: ₦13,000 – ₦9,000\n"
-                "• 🔄 Indirect Bonus: ₦500 – ₦250\n"
-                "• 🌀 2nd Indirect Bonus: ₦200 – ₦100\n"
-                "— — —\n\n"
-                "🏦 PAYMENT INFO\n"
-                "• 📆 MONDAYS, WEDNESDAYS, AND FRIDAYS\n\n"
-                "🎓 You’ll also be added to a mentorship class to learn how to make up to ₦300,000 weekly with the opportunities on Tapify after registration.\n"
-                " Ensure to listen to the Voice Note below to understand more about our features...",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+        except psycopg.Error as e:
+            logger.error("Database error in approve_coupon: %s", e)
+            await query.edit_message_text("An error occurred. Please try again.")
+    elif kind == "task":
+        task_id, _, user_chat_id = ids.partition("_")
+        task_id, user_chat_id = int(task_id), int(user_chat_id)
+        try:
+            reward = award_task(user_chat_id, task_id)
+            await notify_user_and_edit(
+                context, query, user_chat_id,
+                f"Task approved! You earned ${reward}.",
+                "Task approved and reward awarded.",
+                "Task approved and reward awarded, but the user could not be notified."
             )
-            voice_keyboard = [
-                [InlineKeyboardButton("✅ I'm done listening...", callback_data="close_voice")]
-            ]
-            voice_markup = InlineKeyboardMarkup(voice_keyboard)
-            try:
-                with open("voice.ogg", "rb") as voice:
-                    await context.bot.send_voice(
-                        chat_id=query.message.chat_id,
-                        voice=voice,
-                        caption="Tapify Explained 🎧",
-                        reply_markup=voice_markup
-                    )
-            except FileNotFoundError:
-                logger.error("Voice file 'voice.ogg' not found")
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text="Error: Voice note file not found. Please contact support.",
-                    reply_markup=voice_markup
-                )
-            except Exception as e:
-                logger.error(f"Error sending voice note: {e}")
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text="An error occurred while sending the voice note. Please try again.",
-                    reply_markup=voice_markup
-                )
+        except psycopg.Error as e:
+            logger.error("Database error in approve_task: %s", e)
+            await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data == "close_voice":
-            await query.message.delete()
 
-        elif data == "coupon":
-            user_state[chat_id] = {'expecting': 'coupon_quantity'}
-            keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]
-            await query.edit_message_text(
-                "How many coupons do you want to purchase?",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
+# Reject handlers
+async def _on_reject_reg(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_chat_id = int(query.data.rpartition("_")[2])
+    try:
+        cursor.execute("UPDATE users SET payment_status='rejected' WHERE chat_id=%s", (user_chat_id,))
+        invalidate_status(user_chat_id)
+        await notify_user_and_edit(
+            context, query, user_chat_id,
+            "❌ Your payment was rejected by the admin. Please re-check your payment and resend a proper screenshot of your payment made to any of the provided account or contact @bigscottmedia to rectify your issues.",
+            "Payment rejected and user notified.",
+            "Payment rejected, but the user could not be notified."
+        )
+    except psycopg.Error as e:
+        logger.error("Database error in reject_reg: %s", e)
+        await query.edit_message_text("An error occurred while rejecting. Please try again.")
 
-        # Coupon package selection: now supports Standard and X
-        elif data in ["coupon_standard", "coupon_x"]:
-            package = "Standard" if data == "coupon_standard" else "X"
-            # Price mapping: Standard = 10000, X = 15000 (per your instruction)
-            price = 10000 if package == "Standard" else 15000
-            quantity = user_state.get(chat_id, {}).get('coupon_quantity')
-            if not quantity:
-                await query.edit_message_text("Quantity not found. Please start coupon purchase again.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]))
-                return
-            total = quantity * price
-            user_state[chat_id].update({'coupon_package': package, 'coupon_total': total})
 
-            await context.bot.send_message(
-                ADMIN_ID,
-                f"User @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id}) wants to purchase {quantity} {package} coupons for ₦{total}."
+async def _on_reject_coupon(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    payment_id = int(query.data.rpartition("_")[2])
+    try:
+        tuple_cursor.execute("UPDATE payments SET status='rejected' WHERE id=%s RETURNING chat_id", (payment_id,))
+        row = tuple_cursor.fetchone()
+        if row:
+            await notify_user_and_edit(
+                context, query, row[0],
+                "❌ Your coupon payment was rejected by the admin. Please check your payment and resend a clear screenshot or contact @bigscottmedia.",
+                "Coupon payment rejected and user notified.",
+                "Coupon payment rejected, but the user could not be notified."
             )
+        else:
+            await query.edit_message_text("Coupon payment rejected and user notified.")
+    except psycopg.Error as e:
+        logger.error("Database error in reject_coupon: %s", e)
+        await query.edit_message_text("An error occurred while rejecting. Please try again.")
 
-            keyboard = [[InlineKeyboardButton(a, callback_data=f"coupon_account_{a}")] for a in COUPON_PAYMENT_ACCOUNTS.keys()]
-            keyboard.append([InlineKeyboardButton("Other country option", callback_data="coupon_other")])
-            keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
 
-            await query.edit_message_text(
-                f"You are purchasing {quantity} {package} coupons.\nTotal amount: ₦{total}\n\nSelect the account to pay to:",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+async def _on_finalize_reg(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_chat_id = int(query.data.rpartition("_")[2])
+    user_state[ADMIN_ID] = {'expecting': 'user_credentials', 'for_user': user_chat_id}
+    await asyncio.gather(
+        context.bot.send_message(
+            ADMIN_ID,
+            f"Please send the username and password for user {user_chat_id} in the format:\nusername\npassword"
+        ),
+        query.edit_message_text("Waiting for user credentials.")
+    )
+
+
+async def _on_reject_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    task_id, _, user_chat_id = query.data[len("reject_task_"):].partition("_")
+    task_id, user_chat_id = int(task_id), int(user_chat_id)
+    try:
+        # Deduct the reward only if the balance covers it, and drop the completion in the same statement
+        tuple_cursor.execute("""
+            WITH t AS (SELECT reward FROM tasks WHERE id = %s),
+            revoked AS (
+                UPDATE users SET balance = balance - (SELECT reward FROM t)
+                WHERE chat_id = %s AND balance >= (SELECT reward FROM t)
+                RETURNING chat_id
+            ),
+            removed AS (
+                DELETE FROM user_tasks
+                WHERE user_id = %s AND task_id = %s AND EXISTS (SELECT 1 FROM revoked)
+            )
+            SELECT EXISTS (SELECT 1 FROM revoked)
+        """, (task_id, user_chat_id, user_chat_id, task_id))
+        if tuple_cursor.fetchone()[0]:
+            await notify_user_and_edit(
+                context, query, user_chat_id,
+                "Task verification rejected. Reward revoked.",
+                "Task rejected and reward removed.",
+                "Task rejected and reward removed, but the user could not be notified."
             )
+        else:
+            await query.edit_message_text("Task rejected, but balance insufficient to revoke reward.")
+    except psycopg.Error as e:
+        logger.error("Database error in reject_task: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data.startswith("coupon_account_"):
-            account = data[len("coupon_account_"):]
-            payment_details = COUPON_PAYMENT_ACCOUNTS.get(account)
-            if not payment_details:
-                await context.bot.send_message(chat_id, "Error: Invalid account. Contact @bigscottmedia.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]))
-                return
-            user_state.setdefault(chat_id, {})
-            user_state[chat_id]['selected_account'] = account
-            user_state[chat_id]['expecting'] = 'coupon_screenshot'
-            package = user_state[chat_id].get('coupon_package')
-            quantity = user_state[chat_id].get('coupon_quantity')
-            total = user_state[chat_id].get('coupon_total')
-            # Insert a payment row for coupon purchase (is_upgrade False)
-            try:
-                cursor.execute(
-                    "INSERT INTO payments (chat_id, type, package, quantity, total_amount, payment_account, is_upgrade, status) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                    (chat_id, 'coupon', package, quantity, total, account, False, 'pending_payment')
-                )
-                payment_id = cursor.fetchone()["id"]
-                conn.commit()
-                user_state[chat_id]['waiting_approval'] = {'type': 'coupon', 'payment_id': payment_id}
-                keyboard = [
-                    [InlineKeyboardButton("Change Account", callback_data="show_coupon_account_selection")],
-                    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]
-                ]
-                await context.bot.send_message(
-                    chat_id,
-                    f"Payment details:\n\n{payment_details}\n\nPlease make the payment and send the screenshot.",
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-            except psycopg.Error as e:
-                logger.error(f"Database error creating coupon payment: {e}")
-                await query.edit_message_text("An error occurred creating payment. Please try again.")
 
-        elif data == "show_coupon_account_selection":
-            keyboard = [[InlineKeyboardButton(a, callback_data=f"coupon_account_{a}")] for a in COUPON_PAYMENT_ACCOUNTS.keys()]
-            keyboard.append([InlineKeyboardButton("Other country option", callback_data="coupon_other")])
-            keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
-            await query.edit_message_text("Select an account to pay to:", reply_markup=InlineKeyboardMarkup(keyboard))
+async def _on_pending(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    kind, _, ids = query.data.partition("_")[2].partition("_")
+    if kind == "reg":
+        await context.bot.send_message(int(ids), "Your payment is still being reviewed. Please check back later.")
+    elif kind == "coupon":
+        payment_id, _, user_chat_id = ids.partition("_")
+        try:
+            if user_chat_id:
+                user_chat_id = int(user_chat_id)
+            else:
+                # Buttons sent before the chat_id was embedded carry only the payment id
+                tuple_cursor.execute("SELECT chat_id FROM payments WHERE id=%s", (int(payment_id),))
+                user_chat_id = tuple_cursor.fetchone()[0]
+            await context.bot.send_message(user_chat_id, "Your coupon payment is still being reviewed.")
+        except psycopg.Error as e:
+            logger.error("Database error in pending_coupon: %s", e)
+            await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data == "coupon_other":
-            await context.bot.send_message(
-                chat_id,
-                "Please contact @bigscottmedia to complete your payment for other region coupon purchase.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
-            )
 
-        elif data == "package_selector":
-            status = get_status(chat_id)
-            if status == 'registered':
-                await context.bot.send_message(chat_id, "You are already registered.")
-                return
-            # Added reg_x option (Upgrade) here
-            keyboard = [
-                [InlineKeyboardButton("✈Tapify Lite Package (₦10,000)", callback_data="reg_standard")],
-                [InlineKeyboardButton("🚀Tapify Pro Package (₦15,000)", callback_data="reg_x")],
-                [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")],
-            ]
-            await query.edit_message_text("Choose your package:", reply_markup=InlineKeyboardMarkup(keyboard))
+async def _on_check_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.callback_query.from_user.id
+    if 'waiting_approval' not in user_state.get(chat_id, {}):
+        await context.bot.send_message(chat_id, "You have no pending payments.")
+        return
+    approval = user_state[chat_id]['waiting_approval']
+    if approval['type'] == 'registration':
+        status = get_status(chat_id)
+        if status == 'pending_details':
+            user_state[chat_id] = {'expecting': 'name'}
+            await context.bot.send_message(chat_id, "Payment approved. Please provide your full name:")
+        elif status == 'registered':
+            await context.bot.send_message(chat_id, "Your registration is complete.")
+        else:
+            await context.bot.send_message(chat_id, "Your payment is being reviewed.")
+    elif approval['type'] == 'coupon':
+        payment_id = approval['payment_id']
+        try:
+            tuple_cursor.execute("SELECT status FROM payments WHERE id=%s", (payment_id,))
+            status = tuple_cursor.fetchone()[0]
+            if status == 'approved':
+                await context.bot.send_message(chat_id, "Coupon payment approved. Check your coupons above.")
+            else:
+                await context.bot.send_message(chat_id, "Your coupon payment is being reviewed.")
+        except psycopg.Error as e:
+            logger.error("Database error in check_approval: %s", e)
+            await context.bot.send_message(chat_id, "An error occurred. Please try again.")
 
-        elif data in ["reg_standard", "reg_x"]:
-            package = "Standard" if data == "reg_standard" else "X"
-            # Mark upgrade True for X
-            user_state[chat_id] = {'package': package, 'upgrade': True if package == "X" else False}
-            try:
-                cursor.execute("UPDATE users SET package=%s, payment_status='pending_payment' WHERE chat_id=%s", (package, chat_id))
-                if cursor.rowcount == 0:
-                    cursor.execute("INSERT INTO users (chat_id, package, payment_status, username) VALUES (%s, %s, 'pending_payment', %s)", (chat_id, package, update.effective_user.username or "Unknown"))
-                conn.commit()
-                keyboard = [[InlineKeyboardButton(a, callback_data=f"reg_account_{a}")] for a in PAYMENT_ACCOUNTS.keys()]
-                keyboard.append([InlineKeyboardButton("Other country option", callback_data="reg_other")])
-                keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
-                await query.edit_message_text("Select an account to pay to:", reply_markup=InlineKeyboardMarkup(keyboard))
-            except psycopg.Error as e:
-                logger.error(f"Database error in package_selector: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
-                return
 
-        elif data.startswith("reg_account_"):
-            account = data[len("reg_account_"):]
-            payment_details = PAYMENT_ACCOUNTS.get(account)
-            if not payment_details:
-                await context.bot.send_message(chat_id, "Error: Invalid account. Contact @bigscottmedia.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]))
-                return
-            # set selected account and expecting screenshot
-            user_state.setdefault(chat_id, {})
-            user_state[chat_id]['selected_account'] = account
-            user_state[chat_id]['expecting'] = 'reg_screenshot'
-            # include package + upgrade marker in waiting_approval for clarity
-            user_state[chat_id]['waiting_approval'] = {'type': 'registration', 'package': user_state[chat_id].get('package'), 'is_upgrade': user_state[chat_id].get('upgrade', False)}
-            keyboard = [
-                [InlineKeyboardButton("Change Account", callback_data="show_account_selection")],
-                [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]
-            ]
-            await context.bot.send_message(
-                chat_id,
-                f"Payment details:\n\n{payment_details}\n\nPlease make the payment and send the screenshot.",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            # Optional: alert admin that a registration payment flow started (with upgrade tag)
-            try:
-                upgrade_tag = " --Upgrade" if user_state[chat_id].get('upgrade') else ""
-                await context.bot.send_message(ADMIN_ID, f"User @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id}) started registration for {user_state[chat_id].get('package')}{upgrade_tag}. Waiting for screenshot.")
-            except Exception:
-                pass
-
-        elif data == "show_account_selection":
-            package = user_state.get(chat_id, {}).get('package', '')
-            if not package:
-                await query.edit_message_text("Please select a package first.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]))
-                return
-            keyboard = [[InlineKeyboardButton(a, callback_data=f"reg_account_{a}")] for a in PAYMENT_ACCOUNTS.keys()]
-            keyboard.append([InlineKeyboardButton("Other country option", callback_data="reg_other")])
-            keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
-            await query.edit_message_text("Select an account to pay to:", reply_markup=InlineKeyboardMarkup(keyboard))
+async def _on_toggle_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    try:
+        tuple_cursor.execute(
+            "UPDATE users SET alarm_setting = CASE WHEN alarm_setting = 0 THEN 1 ELSE 0 END WHERE chat_id=%s RETURNING alarm_setting",
+            (chat_id,)
+        )
+        new_setting = tuple_cursor.fetchone()[0]
+        status = "enabled" if new_setting == 1 else "disabled"
+        await query.edit_message_text(f"Daily reminder {status}.", reply_markup=HELP_BACK_MARKUP)
+    except psycopg.Error as e:
+        logger.error("Database error in toggle_reminder: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data == "reg_other":
-            await context.bot.send_message(
-                chat_id,
-                "Please contact @bigscottmedia to complete your payment for other region registration.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
+
+async def _on_boost_ai(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(
+        f"🚀 Boost with AI\n\nAccess Advanced AI-powered features to maximize your earnings: {AI_BOOST_LINK}",
+        reply_markup=MAIN_MENU_MARKUP
+    )
+
+
+async def _on_user_registered(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    try:
+        tuple_cursor.execute("SELECT username, email, password, package FROM users WHERE chat_id=%s", (chat_id,))
+        user = tuple_cursor.fetchone()
+        if user:
+            username, email, password, package = user
+            await query.edit_message_text(
+                f"🎉 Registration Complete!\n\n"
+                f"• Site: {SITE_LINK}\n"
+                f"• Username: {username}\n"
+                f"• Email: {email}\n"
+                f"• Password: {password}\n\n"
+                "Keep your credentials safe. Use 'Password Recovery' in the Help menu if needed.",
+                reply_markup=MAIN_MENU_MARKUP
             )
+        else:
+            await query.edit_message_text("No registration data found.", reply_markup=MAIN_MENU_MARKUP)
+    except psycopg.Error as e:
+        logger.error("Database error in user_registered: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
 
-        # Approve handlers
-        elif data.startswith("approve_"):
-            parts = data.split("_")
-            if parts[1] == "reg":
-                user_chat_id = int(parts[2])
-                try:
-                    cursor.execute("UPDATE users SET payment_status='pending_details', approved_at=%s WHERE chat_id=%s", (datetime.datetime.now(), user_chat_id))
-                    conn.commit()
-                    user_state[user_chat_id] = {'expecting': 'name'}
-                    await context.bot.send_message(
-                        user_chat_id,
-                        "✅ Your payment is approved!\n\nPlease provide your full name:"
-                    )
-                    await query.edit_message_text("Payment approved. Waiting for user details.")
-                except psycopg.Error as e:
-                    logger.error(f"Database error in approve_reg: {e}")
-                    await query.edit_message_text("An error occurred. Please try again.")
-            elif parts[1] == "coupon":
-                payment_id = int(parts[2])
-                try:
-                    cursor.execute("UPDATE payments SET status='approved', approved_at=%s WHERE id=%s", (datetime.datetime.now(), payment_id))
-                    conn.commit()
-                    user_state[ADMIN_ID] = {'expecting': {'type': 'coupon_codes', 'payment_id': payment_id}}
-                    await context.bot.send_message(ADMIN_ID, f"Payment {payment_id} approved. Please send the coupon codes (one per line).")
-                    await query.edit_message_text("Payment approved. Waiting for coupon codes.")
-                except psycopg.Error as e:
-                    logger.error(f"Database error in approve_coupon: {e}")
-                    await query.edit_message_text("An error occurred. Please try again.")
-            elif parts[1] == "task":
-                task_id = int(parts[2])
-                user_chat_id = int(parts[3])
-                try:
-                    cursor.execute("INSERT INTO user_tasks (user_id, task_id, completed_at) VALUES (%s, %s, %s)", (user_chat_id, task_id, datetime.datetime.now()))
-                    cursor.execute("SELECT reward FROM tasks WHERE id=%s", (task_id,))
-                    reward = cursor.fetchone()["reward"]
-                    cursor.execute("UPDATE users SET balance = balance + %s WHERE chat_id=%s", (reward, user_chat_id))
-                    conn.commit()
-                    await context.bot.send_message(user_chat_id, f"Task approved! You earned ${reward}.")
-                    await query.edit_message_text("Task approved and reward awarded.")
-                except psycopg.Error as e:
-                    logger.error(f"Database error in approve_task: {e}")
-                    await query.edit_message_text("An error occurred. Please try again.")
-
-        # Reject handlers (new)
-        elif data.startswith("reject_reg_"):
-            user_chat_id = int(data.split("_")[2])
-            try:
-                cursor.execute("UPDATE users SET payment_status='rejected' WHERE chat_id=%s", (user_chat_id,))
-                conn.commit()
-                await context.bot.send_message(user_chat_id, "❌ Your payment was rejected by the admin. Please re-check your payment and resend a proper screenshot of your payment made to any of the provided account or contact @bigscottmedia to rectify your issues.")
-                await query.edit_message_text("Payment rejected and user notified.")
-            except psycopg.Error as e:
-                logger.error(f"Database error in reject_reg: {e}")
-                await query.edit_message_text("An error occurred while rejecting. Please try again.")
 
-        elif data.startswith("reject_coupon_"):
-            payment_id = int(data.split("_")[2])
-            try:
-                cursor.execute("UPDATE payments SET status='rejected' WHERE id=%s", (payment_id,))
-                conn.commit()
-                cursor.execute("SELECT chat_id FROM payments WHERE id=%s", (payment_id,))
-                row = cursor.fetchone()
-                if row:
-                    user_chat_id = row["chat_id"]
-                    await context.bot.send_message(user_chat_id, "❌ Your coupon payment was rejected by the admin. Please check your payment and resend a clear screenshot or contact @bigscottmedia.")
-                await query.edit_message_text("Coupon payment rejected and user notified.")
-            except psycopg.Error as e:
-                logger.error(f"Database error in reject_coupon: {e}")
-                await query.edit_message_text("An error occurred while rejecting. Please try again.")
+async def _on_daily_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    _, package = get_user_brief(chat_id)
+    msg = f"Follow this link to perform your daily tasks and earn: {DAILY_TASK_LINK}"
+    if package == "X":
+        msg = f"🌟 X Users: Maximize your earnings with this special daily task link: {DAILY_TASK_LINK}"
+    await query.edit_message_text(msg, reply_markup=MAIN_MENU_MARKUP)
 
-        elif data.startswith("finalize_reg_"):
-            user_chat_id = int(data.split("_")[2])
-            user_state[ADMIN_ID] = {'expecting': 'user_credentials', 'for_user': user_chat_id}
-            await context.bot.send_message(
-                ADMIN_ID,
-                f"Please send the username and password for user {user_chat_id} in the format:\nusername\npassword"
+
+async def _on_earn_extra(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    now = datetime.datetime.now()
+    try:
+        tuple_cursor.execute("""
+            SELECT t.id, t.type, t.link, t.reward
+            FROM tasks t
+            LEFT JOIN user_tasks ut ON ut.task_id = t.id AND ut.user_id = %s
+            WHERE t.expires_at > %s
+            AND ut.task_id IS NULL
+        """, (chat_id, now), prepare=True)
+        tasks = tuple_cursor.fetchall()
+        if not tasks:
+            await query.edit_message_text(
+                "No extra tasks available right now. Please check back later.",
+                reply_markup=MAIN_MENU_MARKUP
             )
-            await query.edit_message_text("Waiting for user credentials.")
+            return
+        keyboard = []
+        for task_id, task_type, link, reward in tasks:
+            join_button = InlineKeyboardButton(f"Join {task_type} (${reward})", url=link)
+            verify_button = InlineKeyboardButton("Verify", callback_data=f"verify_task_{task_id}")
+            keyboard.append([join_button, verify_button])
+        keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
+        await query.edit_message_text("Available extra tasks for today:", reply_markup=InlineKeyboardMarkup(keyboard))
+    except psycopg.Error as e:
+        logger.error("Database error in earn_extra: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
+
 
-        elif data.startswith("reject_task_"):
-            parts = data.split("_")
-            task_id = int(parts[2])
-            user_chat_id = int(parts[3])
+async def _on_verify_task(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    data = query.data
+    task_id = int(data[len("verify_task_"):])
+    try:
+        tuple_cursor.execute("SELECT type, link FROM tasks WHERE id=%s", (task_id,), prepare=True)
+        task = tuple_cursor.fetchone()
+        if not task:
+            await query.answer("Task not found.")
+            return
+        task_type, link = task
+        m = TG_LINK_RE.search(link)
+        chat_username = m.group() if m else None
+        if chat_username and chat_username.startswith("http"):
+            chat_username = chat_username.split("/")[-1]
+        if task_type in ["join_group", "join_channel"]:
             try:
-                cursor.execute("SELECT balance FROM users WHERE chat_id=%s", (user_chat_id,))
-                balance = cursor.fetchone()["balance"]
-                cursor.execute("SELECT reward FROM tasks WHERE id=%s", (task_id,))
-                reward = cursor.fetchone()["reward"]
-                if balance >= reward:
-                    cursor.execute("UPDATE users SET balance = balance - %s WHERE chat_id=%s", (reward, user_chat_id))
-                    cursor.execute("DELETE FROM user_tasks WHERE user_id=%s AND task_id=%s", (user_chat_id, task_id))
-                    conn.commit()
-                    await context.bot.send_message(user_chat_id, "Task verification rejected. Reward revoked.")
-                    await query.edit_message_text("Task rejected and reward removed.")
+                if await get_member_status(context.bot, chat_username, chat_id) in MEMBER_STATUSES:
+                    reward = award_task(chat_id, task_id)
+                    await query.answer(f"Task completed! You earned ${reward}.")
                 else:
-                    await query.edit_message_text("Task rejected, but balance insufficient to revoke reward.")
-            except psycopg.Error as e:
-                logger.error(f"Database error in reject_task: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
-
-        elif data.startswith("pending_"):
-            parts = data.split("_")
-            if parts[1] == "reg":
-                await context.bot.send_message(int(parts[2]), "Your payment is still being reviewed. Please check back later.")
-            elif parts[1] == "coupon":
-                payment_id = int(parts[2])
-                try:
-                    cursor.execute("SELECT chat_id FROM payments WHERE id=%s", (payment_id,))
-                    user_chat_id = cursor.fetchone()["chat_id"]
-                    await context.bot.send_message(user_chat_id, "Your coupon payment is still being reviewed.")
-                except psycopg.Error as e:
-                    logger.error(f"Database error in pending_coupon: {e}")
-                    await query.edit_message_text("An error occurred. Please try again.")
-
-        elif data == "check_approval":
-            if 'waiting_approval' not in user_state.get(chat_id, {}):
-                await context.bot.send_message(chat_id, "You have no pending payments.")
-                return
-            approval = user_state[chat_id]['waiting_approval']
-            if approval['type'] == 'registration':
-                status = get_status(chat_id)
-                if status == 'pending_details':
-                    user_state[chat_id] = {'expecting': 'name'}
-                    await context.bot.send_message(chat_id, "Payment approved. Please provide your full name:")
-                elif status == 'registered':
-                    await context.bot.send_message(chat_id, "Your registration is complete.")
-                else:
-                    await context.bot.send_message(chat_id, "Your payment is being reviewed.")
-            elif approval['type'] == 'coupon':
-                payment_id = approval['payment_id']
-                try:
-                    cursor.execute("SELECT status FROM payments WHERE id=%s", (payment_id,))
-                    status = cursor.fetchone()["status"]
-                    if status == 'approved':
-                        await context.bot.send_message(chat_id, "Coupon payment approved. Check your coupons above.")
-                    else:
-                        await context.bot.send_message(chat_id, "Your coupon payment is being reviewed.")
-                except psycopg.Error as e:
-                    logger.error(f"Database error in check_approval: {e}")
-                    await context.bot.send_message(chat_id, "An error occurred. Please try again.")
-
-        elif data == "toggle_reminder":
-            try:
-                cursor.execute("SELECT alarm_setting FROM users WHERE chat_id=%s", (chat_id,))
-                current_setting = cursor.fetchone()["alarm_setting"]
-                new_setting = 1 if current_setting == 0 else 0
-                cursor.execute("UPDATE users SET alarm_setting=%s WHERE chat_id=%s", (new_setting, chat_id))
-                conn.commit()
-                status = "enabled" if new_setting == 1 else "disabled"
-                await query.edit_message_text(f"Daily reminder {status}.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Help Menu", callback_data="help")]]))
-            except psycopg.Error as e:
-                logger.error(f"Database error in toggle_reminder: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
+                    await query.answer("You are not in the group/channel yet.")
+            except Exception as e:
+                logger.error("Error verifying task: %s", e)
+                await query.answer("Error verifying task. Try again later.")
+        elif task_type == "external_task":
+            user_state[chat_id] = {'expecting': 'task_screenshot', 'task_id': task_id}
+            await context.bot.send_message(chat_id, f"Please send the screenshot for task #{task_id} verification.")
+    except psycopg.Error as e:
+        logger.error("Database error in verify_task: %s", e)
+        await query.answer("An error occurred. Please try again.")
+
 
-        elif data == "boost_ai":
+async def _on_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text("Select a question or ask your own:", reply_markup=FAQ_MENU_MARKUP)
+
+
+async def _on_faq_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    data = query.data
+    faq_key = data[len("faq_"):]
+    if faq_key == "custom":
+        user_state.setdefault(chat_id, {})['expecting'] = 'faq'
+        await query.edit_message_text("Please type your question:", reply_markup=HELP_BACK_MARKUP)
+    else:
+        faq = FAQS.get(faq_key)
+        if faq:
             await query.edit_message_text(
-                f"🚀 Boost with AI\n\nAccess Advanced AI-powered features to maximize your earnings: {AI_BOOST_LINK}",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
+                f"❓ {faq['question']}\n\n{faq['answer']}",
+                reply_markup=FAQ_ANSWER_MARKUP
             )
+        else:
+            await query.edit_message_text("FAQ not found.", reply_markup=HELP_BACK_MARKUP)
 
-        elif data == "user_registered":
-            try:
-                cursor.execute("SELECT username, email, password, package FROM users WHERE chat_id=%s", (chat_id,))
-                user = cursor.fetchone()
-                if user:
-                    username, email, password, package = user.values()
-                    await query.edit_message_text(
-                        f"🎉 Registration Complete!\n\n"
-                        f"• Site: {SITE_LINK}\n"
-                        f"• Username: {username}\n"
-                        f"• Email: {email}\n"
-                        f"• Password: {password}\n\n"
-                        "Keep your credentials safe. Use 'Password Recovery' in the Help menu if needed.",
-                        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
-                    )
-                else:
-                    await query.edit_message_text("No registration data found.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]))
-            except psycopg.Error as e:
-                logger.error(f"Database error in user_registered: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data == "daily_tasks":
-            try:
-                cursor.execute("SELECT package FROM users WHERE chat_id=%s", (chat_id,))
-                package = cursor.fetchone()["package"]
-                msg = f"Follow this link to perform your daily tasks and earn: {DAILY_TASK_LINK}"
-                if package == "X":
-                    msg = f"🌟 X Users: Maximize your earnings with this special daily task link: {DAILY_TASK_LINK}"
-                await query.edit_message_text(msg, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]]))
-            except psycopg.Error as e:
-                logger.error(f"Database error in daily_tasks: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
+async def _on_help_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    data = query.data
+    topic = HELP_TOPICS[data]
+    if topic["type"] == "input":
+        user_state.setdefault(chat_id, {})['expecting'] = data
+        await query.edit_message_text(topic["text"], reply_markup=HELP_BACK_MARKUP)
+    elif topic["type"] == "toggle":
+        await query.edit_message_text("Toggle your daily reminder:", reply_markup=REMINDER_TOGGLE_MARKUP)
+    elif topic["type"] == "faq":
+        await _on_faq(update, context)
+    else:
+        content = topic["text"] if topic["type"] == "text" else f"Watch here: {topic['url']}"
+        await query.edit_message_text(content, reply_markup=HELP_BACK_MARKUP)
 
-        elif data == "earn_extra":
-            now = datetime.datetime.now()
-            try:
-                cursor.execute("""
-                    SELECT t.id, t.type, t.link, t.reward
-                    FROM tasks t
-                    WHERE t.expires_at > %s
-                    AND t.id NOT IN (SELECT ut.task_id FROM user_tasks ut WHERE ut.user_id = %s)
-                """, (now, chat_id))
-                tasks = cursor.fetchall()
-                if not tasks:
-                    await query.edit_message_text(
-                        "No extra tasks available right now. Please check back later.",
-                        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
-                    )
-                    return
-                keyboard = []
-                for task in tasks:
-                    task_id, task_type, link, reward = task.values()
-                    join_button = InlineKeyboardButton(f"Join {task_type} (${reward})", url=link)
-                    verify_button = InlineKeyboardButton("Verify", callback_data=f"verify_task_{task_id}")
-                    keyboard.append([join_button, verify_button])
-                keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
-                await query.edit_message_text("Available extra tasks for today:", reply_markup=InlineKeyboardMarkup(keyboard))
-            except psycopg.Error as e:
-                logger.error(f"Database error in earn_extra: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data.startswith("verify_task_"):
-            task_id = int(data[len("verify_task_"):])
-            try:
-                cursor.execute("SELECT type, link FROM tasks WHERE id=%s", (task_id,))
-                task = cursor.fetchone()
-                if not task:
-                    await query.answer("Task not found.")
-                    return
-                task_type, link = task.values()
-                regel = re.compile(r'(@[A-Za-z0-9_]+)|(?:https?://)?(?:www\.)?(?:t\.me|telegram\.(?:me|dog))/([A-Za-z0-9_+]+)')
-                m = regel.search(link)
-                chat_username = m.group() if m else None
-                if chat_username and chat_username.startswith("http"):
-                    chat_username = chat_username.split("/")[-1]
-                if task_type in ["join_group", "join_channel"]:
-                    try:
-                        member = await context.bot.get_chat_member(chat_username, chat_id)
-                        if member.status in ["member", "administrator", "creator"]:
-                            cursor.execute("INSERT INTO user_tasks (user_id, task_id, completed_at) VALUES (%s, %s, %s)", (chat_id, task_id, datetime.datetime.now()))
-                            cursor.execute("SELECT reward FROM tasks WHERE id=%s", (task_id,))
-                            reward = cursor.fetchone()["reward"]
-                            cursor.execute("UPDATE users SET balance = balance + %s WHERE chat_id=%s", (reward, chat_id))
-                            conn.commit()
-                            await query.answer(f"Task completed! You earned ${reward}.")
-                        else:
-                            await query.answer("You are not in the group/channel yet.")
-                    except Exception as e:
-                        logger.error(f"Error verifying task: {e}")
-                        await query.answer("Error verifying task. Try again later.")
-                elif task_type == "external_task":
-                    user_state[chat_id] = {'expecting': 'task_screenshot', 'task_id': task_id}
-                    await context.bot.send_message(chat_id, f"Please send the screenshot for task #{task_id} verification.")
-            except psycopg.Error as e:
-                logger.error(f"Database error in verify_task: {e}")
-                await query.answer("An error occurred. Please try again.")
-
-        elif data == "faq":
-            keyboard = [[InlineKeyboardButton(faq["question"], callback_data=f"faq_{key}")] for key, faq in FAQS.items()]
-            keyboard.append([InlineKeyboardButton("Ask Another Question", callback_data="faq_custom")])
-            keyboard.append([InlineKeyboardButton("🔙 Help Menu", callback_data="help")])
-            await query.edit_message_text("Select a question or ask your own:", reply_markup=InlineKeyboardMarkup(keyboard))
-
-        elif data.startswith("faq_"):
-            faq_key = data[len("faq_"):]
-            if faq_key == "custom":
-                user_state.setdefault(chat_id, {})['expecting'] = 'faq'
-                await query.edit_message_text("Please type your question:", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Help Menu", callback_data="help")]]))
-            else:
-                faq = FAQS.get(faq_key)
-                if faq:
-                    await query.edit_message_text(
-                        f"❓ {faq['question']}\n\n{faq['answer']}",
-                        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 FAQ Menu", callback_data="faq"), InlineKeyboardButton("🔙 Help Menu", callback_data="help")]])
-                    )
-                else:
-                    await query.edit_message_text("FAQ not found.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Help Menu", callback_data="help")]]))
-
-        elif data in HELP_TOPICS:
-            topic = HELP_TOPICS[data]
-            keyboard = [[InlineKeyboardButton("🔙 Help Menu", callback_data="help")]]
-            if topic["type"] == "input":
-                user_state.setdefault(chat_id, {})['expecting'] = data
-                await query.edit_message_text(topic["text"], reply_markup=InlineKeyboardMarkup(keyboard))
-            elif topic["type"] == "toggle":
-                keyboard = [
-                    [InlineKeyboardButton("Toggle Reminder On/Off", callback_data="toggle_reminder")],
-                    [InlineKeyboardButton("🔙 Help Menu", callback_data="help")]
-                ]
-                await query.edit_message_text("Toggle your daily reminder:", reply_markup=InlineKeyboardMarkup(keyboard))
-            elif topic["type"] == "faq":
-                await button_handler(update, context)  # Redirect to FAQ handler
-            else:
-                content = topic["text"] if topic["type"] == "text" else f"Watch here: {topic['url']}"
-                await query.edit_message_text(content, reply_markup=InlineKeyboardMarkup(keyboard))
+async def _on_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await help_menu(update, context)
 
-        elif data == "help":
-            await help_menu(update, context)
 
-        elif data == "enable_reminders":
-            try:
-                cursor.execute("UPDATE users SET alarm_setting=1 WHERE chat_id=%s", (chat_id,))
-                conn.commit()
-                await query.edit_message_text(
-                    "✅ Daily reminders enabled!",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
-                )
-            except psycopg.Error as e:
-                logger.error(f"Database error in enable_reminders: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
+async def _on_enable_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    try:
+        cursor.execute("UPDATE users SET alarm_setting=1 WHERE chat_id=%s", (chat_id,))
+        await query.edit_message_text(
+            "✅ Daily reminders enabled!",
+            reply_markup=MAIN_MENU_MARKUP
+        )
+    except psycopg.Error as e:
+        logger.error("Database error in enable_reminders: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
 
-        elif data == "disable_reminders":
-            try:
-                cursor.execute("UPDATE users SET alarm_setting=0 WHERE chat_id=%s", (chat_id,))
-                conn.commit()
-                await query.edit_message_text(
-                    "❌ Okay, daily reminders not set.",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
-                )
-            except psycopg.Error as e:
-                logger.error(f"Database error in disable_reminders: {e}")
-                await query.edit_message_text("An error occurred. Please try again.")
 
-        else:
-            logger.warning(f"Unknown callback data: {data}")
+async def _on_disable_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    chat_id = query.from_user.id
+    try:
+        cursor.execute("UPDATE users SET alarm_setting=0 WHERE chat_id=%s", (chat_id,))
+        await query.edit_message_text(
+            "❌ Okay, daily reminders not set.",
+            reply_markup=MAIN_MENU_MARKUP
+        )
+    except psycopg.Error as e:
+        logger.error("Database error in disable_reminders: %s", e)
+        await query.edit_message_text("An error occurred. Please try again.")
+
+
+# Exact callback_data -> handler, looked up before HELP_TOPICS and the prefixes
+HANDLERS = {
+    "menu": _on_menu,
+    "stats": stats,
+    "refer_friend": _on_refer_friend,
+    "withdraw": _on_withdraw,
+    "how_it_works": _on_how_it_works,
+    "close_voice": _on_close_voice,
+    "coupon": _on_coupon,
+    "coupon_standard": _on_coupon_package,
+    "coupon_x": _on_coupon_package,
+    "show_coupon_account_selection": _on_show_coupon_account_selection,
+    "coupon_other": _on_coupon_other,
+    "package_selector": _on_package_selector,
+    "reg_standard": _on_reg_package,
+    "reg_x": _on_reg_package,
+    "show_account_selection": _on_show_account_selection,
+    "reg_other": _on_reg_other,
+    "check_approval": _on_check_approval,
+    "toggle_reminder": _on_toggle_reminder,
+    "boost_ai": _on_boost_ai,
+    "user_registered": _on_user_registered,
+    "daily_tasks": _on_daily_tasks,
+    "earn_extra": _on_earn_extra,
+    "faq": _on_faq,
+    "help": _on_help,
+    "enable_reminders": _on_enable_reminders,
+    "disable_reminders": _on_disable_reminders,
+}
+
+
+# Parameterised callbacks (ids embedded after the prefix), bucketed by the text
+# before the first "_" so a lookup only tries the prefixes that can match
+PREFIX_HANDLERS = {
+    "coupon": (("coupon_account_", _on_coupon_account),),
+    "reg": (("reg_account_", _on_reg_account),),
+    "approve": (("approve_", _on_approve),),
+    "reject": (
+        ("reject_reg_", _on_reject_reg),
+        ("reject_coupon_", _on_reject_coupon),
+        ("reject_task_", _on_reject_task),
+    ),
+    "finalize": (("finalize_reg_", _on_finalize_reg),),
+    "pending": (("pending_", _on_pending),),
+    "verify": (("verify_task_", _on_verify_task),),
+    "faq": (("faq_", _on_faq_answer),),
+}
+
+
+async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    data = query.data
+    chat_id = query.from_user.id
+    logger.info("Received callback data: %s from chat_id: %s", data, chat_id)
+    await query.answer()
+    log_interaction(chat_id, f"button_{data}")
+
+    try:
+        handler = HANDLERS.get(data)
+        if handler is None and data in HELP_TOPICS:
+            handler = _on_help_topic
+        if handler is None:
+            for prefix, prefix_handler in PREFIX_HANDLERS.get(data.partition("_")[0], ()):
+                if data.startswith(prefix):
+                    handler = prefix_handler
+                    break
+        if handler is None:
+            logger.warning("Unknown callback data: %s", data)
             await query.edit_message_text("Unknown action. Please try again or contact @bigscottmedia.")
+            return
+        await handler(update, context)
     except Exception as e:
-        logger.error(f"Error in button_handler: {e}")
+        logger.error("Error in button_handler: %s", e)
         try:
             await query.edit_message_text("An error occurred. Please try again or contact @bigscottmedia.")
         except Exception:
@@ -1037,67 +1560,76 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 # Message handlers
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def forward_screenshot(update: Update, context: ContextTypes.DEFAULT_TYPE, send, file_id):
+    """Forward a payment or task screenshot to the admin with its review buttons.
+
+    ``send`` is ``context.bot.send_photo`` or ``context.bot.send_document``;
+    both reuse the Telegram ``file_id`` so nothing is re-uploaded.
+    """
     chat_id = update.message.chat_id
-    if 'expecting' not in user_state.get(chat_id, {}):
-        return
     expecting = user_state[chat_id]['expecting']
-    file_id = update.message.photo[-1].file_id
-    logger.info(f"Processing photo for {expecting}")
+    username = update.effective_user.username or 'Unknown'
+    if expecting == 'reg_screenshot':
+        keyboard = [
+            [InlineKeyboardButton("Approve", callback_data=f"approve_reg_{chat_id}")],
+            [InlineKeyboardButton("Pending", callback_data=f"pending_reg_{chat_id}")],
+            [InlineKeyboardButton("Reject", callback_data=f"reject_reg_{chat_id}")]
+        ]
+        # upgrade tag if present
+        is_upgrade = user_state[chat_id].get('upgrade', False) or user_state[chat_id].get('package') == 'X'
+        upgrade_tag = " --Upgrade" if is_upgrade else ""
+        caption = f"📸 Registration Payment from @{username} (chat_id: {chat_id}){upgrade_tag}"
+        reply = "✅ Screenshot received! Awaiting admin approval."
+    elif expecting == 'coupon_screenshot':
+        payment_id = user_state[chat_id]['waiting_approval']['payment_id']
+        keyboard = [
+            [InlineKeyboardButton("Approve", callback_data=f"approve_coupon_{payment_id}")],
+            [InlineKeyboardButton("Pending", callback_data=f"pending_coupon_{payment_id}_{chat_id}")],
+            [InlineKeyboardButton("Reject", callback_data=f"reject_coupon_{payment_id}")]
+        ]
+        caption = f"📸 Coupon Payment from @{username} (chat_id: {chat_id})"
+        reply = "✅ Screenshot received! Awaiting admin approval."
+    elif expecting == 'task_screenshot':
+        task_id = user_state[chat_id]['task_id']
+        keyboard = [
+            [InlineKeyboardButton("Approve", callback_data=f"approve_task_{task_id}_{chat_id}")],
+            [InlineKeyboardButton("Reject", callback_data=f"reject_task_{task_id}_{chat_id}")]
+        ]
+        caption = f"Task #{task_id} verification from @{username} (chat_id: {chat_id})"
+        reply = "Screenshot received. Awaiting admin approval."
+    else:
+        return
+    # Only record the upload (which starts the one-hour follow-up) and
+    # acknowledge it once the admin actually has the screenshot
+    await send(ADMIN_ID, file_id, caption=caption, reply_markup=InlineKeyboardMarkup(keyboard))
+    # The admin has it now; a retry after any later failure would forward a duplicate
+    user_state[chat_id].pop('expecting', None)
     try:
         if expecting == 'reg_screenshot':
             cursor.execute("UPDATE users SET screenshot_uploaded_at=%s WHERE chat_id=%s", (datetime.datetime.now(), chat_id))
-            conn.commit()
-            keyboard = [
-                [InlineKeyboardButton("Approve", callback_data=f"approve_reg_{chat_id}")],
-                [InlineKeyboardButton("Pending", callback_data=f"pending_reg_{chat_id}")],
-                [InlineKeyboardButton("Reject", callback_data=f"reject_reg_{chat_id}")]
-            ]
-            # upgrade tag if present
-            is_upgrade = user_state.get(chat_id, {}).get('upgrade', False) or (user_state.get(chat_id, {}).get('package') == 'X')
-            upgrade_tag = " --Upgrade" if is_upgrade else ""
-            await context.bot.send_photo(
-                ADMIN_ID,
-                file_id,
-                caption=f"📸 Registration Payment from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id}){upgrade_tag}",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            await update.message.reply_text("✅ Screenshot received! Awaiting admin approval.")
-            user_state[chat_id]['waiting_approval'] = {'type': 'registration', 'is_upgrade': is_upgrade}
-            context.job_queue.run_once(check_registration_payment, 3600, data={'chat_id': chat_id})
         elif expecting == 'coupon_screenshot':
-            payment_id = user_state[chat_id]['waiting_approval']['payment_id']
-            keyboard = [
-                [InlineKeyboardButton("Approve", callback_data=f"approve_coupon_{payment_id}")],
-                [InlineKeyboardButton("Pending", callback_data=f"pending_coupon_{payment_id}")],
-                [InlineKeyboardButton("Reject", callback_data=f"reject_coupon_{payment_id}")]
-            ]
-            await context.bot.send_photo(
-                ADMIN_ID,
-                file_id,
-                caption=f"📸 Coupon Payment from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id})",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            await update.message.reply_text("✅ Screenshot received! Awaiting admin approval.")
-            context.job_queue.run_once(check_coupon_payment, 3600, data={'payment_id': payment_id})
-        elif expecting == 'task_screenshot':
-            task_id = user_state[chat_id]['task_id']
-            await context.bot.send_photo(
-                ADMIN_ID,
-                file_id,
-                caption=f"Task #{task_id} verification from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id})",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Approve", callback_data=f"approve_task_{task_id}_{chat_id}")],
-                    [InlineKeyboardButton("Reject", callback_data=f"reject_task_{task_id}_{chat_id}")]
-                ])
-            )
-            await update.message.reply_text("Screenshot received. Awaiting admin approval.")
+            cursor.execute("UPDATE payments SET screenshot_uploaded_at=%s WHERE id=%s", (datetime.datetime.now(), payment_id))
+    except psycopg.Error as e:
+        logger.error("Database error recording screenshot upload for %s: %s", chat_id, e)
+    await update.message.reply_text(reply)
+    if expecting == 'reg_screenshot':
+        user_state[chat_id]['waiting_approval'] = {'type': 'registration', 'is_upgrade': is_upgrade}
+
+
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.message.chat_id
+    if 'expecting' not in user_state.get(chat_id, {}):
+        return
+    file_id = update.message.photo[-1].file_id
+    logger.info("Processing photo for %s", user_state[chat_id]['expecting'])
+    try:
+        await forward_screenshot(update, context, context.bot.send_photo, file_id)
         # cleanup expecting key
         if 'expecting' in user_state.get(chat_id, {}):
             user_state[chat_id].pop('expecting', None)
         log_interaction(chat_id, "photo_upload")
     except Exception as e:
-        logger.error(f"Error in handle_photo: {e}")
+        logger.error("Error in handle_photo: %s", e)
         await update.message.reply_text("An error occurred. Please try again or contact @bigscottmedia.")
 
 
@@ -1105,65 +1637,19 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
     if 'expecting' not in user_state.get(chat_id, {}):
         return
-    expecting = user_state[chat_id]['expecting']
     file_id = update.message.document.file_id
     mime_type = update.message.document.mime_type
     if not mime_type.startswith('image/'):
         await update.message.reply_text("Please send an image file (e.g., PNG, JPG).")
         return
-    logger.info(f"Processing document for {expecting}")
+    logger.info("Processing document for %s", user_state[chat_id]['expecting'])
     try:
-        if expecting == 'reg_screenshot':
-            cursor.execute("UPDATE users SET screenshot_uploaded_at=%s WHERE chat_id=%s", (datetime.datetime.now(), chat_id))
-            conn.commit()
-            keyboard = [
-                [InlineKeyboardButton("Approve", callback_data=f"approve_reg_{chat_id}")],
-                [InlineKeyboardButton("Pending", callback_data=f"pending_reg_{chat_id}")],
-                [InlineKeyboardButton("Reject", callback_data=f"reject_reg_{chat_id}")]
-            ]
-            is_upgrade = user_state.get(chat_id, {}).get('upgrade', False) or (user_state.get(chat_id, {}).get('package') == 'X')
-            upgrade_tag = " --Upgrade" if is_upgrade else ""
-            await context.bot.send_document(
-                ADMIN_ID,
-                file_id,
-                caption=f"📸 Registration Payment from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id}){upgrade_tag}",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            await update.message.reply_text("✅ Screenshot received! Awaiting admin approval.")
-            user_state[chat_id]['waiting_approval'] = {'type': 'registration', 'is_upgrade': is_upgrade}
-            context.job_queue.run_once(check_registration_payment, 3600, data={'chat_id': chat_id})
-        elif expecting == 'coupon_screenshot':
-            payment_id = user_state[chat_id]['waiting_approval']['payment_id']
-            keyboard = [
-                [InlineKeyboardButton("Approve", callback_data=f"approve_coupon_{payment_id}")],
-                [InlineKeyboardButton("Pending", callback_data=f"pending_coupon_{payment_id}")],
-                [InlineKeyboardButton("Reject", callback_data=f"reject_coupon_{payment_id}")]
-            ]
-            await context.bot.send_document(
-                ADMIN_ID,
-                file_id,
-                caption=f"📸 Coupon Payment from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id})",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-            await update.message.reply_text("✅ Screenshot received! Awaiting admin approval.")
-            context.job_queue.run_once(check_coupon_payment, 3600, data={'payment_id': payment_id})
-        elif expecting == 'task_screenshot':
-            task_id = user_state[chat_id]['task_id']
-            await context.bot.send_document(
-                ADMIN_ID,
-                file_id,
-                caption=f"Task #{task_id} verification from @{update.effective_user.username or 'Unknown'} (chat_id: {chat_id})",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("Approve", callback_data=f"approve_task_{task_id}_{chat_id}")],
-                    [InlineKeyboardButton("Reject", callback_data=f"reject_task_{task_id}_{chat_id}")]
-                ])
-            )
-            await update.message.reply_text("Screenshot received. Awaiting admin approval.")
+        await forward_screenshot(update, context, context.bot.send_document, file_id)
         if 'expecting' in user_state.get(chat_id, {}):
             user_state[chat_id].pop('expecting', None)
         log_interaction(chat_id, "document_upload")
     except Exception as e:
-        logger.error(f"Error in handle_document: {e}")
+        logger.error("Error in handle_document: %s", e)
         await update.message.reply_text("An error occurred. Please try again or contact @bigscottmedia.")
 
 
@@ -1171,7 +1657,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
     text = update.message.text.strip()
     log_interaction(chat_id, "text_message")
-    logger.info(f"user_state[{chat_id}] = {user_state.get(chat_id, 'None')}")
+    logger.info("user_state[%s] = %s", chat_id, user_state.get(chat_id, 'None'))
     if 'expecting' not in user_state.get(chat_id, {}):
         status = get_status(chat_id)
         if status == 'pending_details':
@@ -1193,7 +1679,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Email flow
         elif expecting == 'email':
             email = text
-            if not re.match(r"[^@]+@[^@]+\.[^@]+", email):
+            if not EMAIL_RE.match(email):
                 await update.message.reply_text("Please provide a valid email address.")
                 return
             user_state[chat_id]['email'] = email
@@ -1203,7 +1689,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Phone flow
         elif expecting == 'phone':
             phone = text
-            if not re.match(r"\+?\d{10,15}", phone):
+            if not PHONE_RE.match(phone):
                 await update.message.reply_text("Please provide a valid phone number.")
                 return
             user_state[chat_id]['phone'] = phone
@@ -1213,31 +1699,29 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Telegram handle and finalize details
         elif expecting == 'telegram_username':
             telegram_username = text
-            if not re.match(r"^@[A-Za-z0-9_]{5,}$", telegram_username):
+            if not TG_USER_RE.match(telegram_username):
                 await update.message.reply_text("Please provide a valid Telegram username starting with @ (e.g., @bigscott).")
                 return
             try:
-                cursor.execute(
-                    "UPDATE users SET name=%s, email=%s, phone=%s, username=%s WHERE chat_id=%s",
-                    (user_state[chat_id]['name'], user_state[chat_id]['email'], user_state[chat_id]['phone'], telegram_username, chat_id)
+                state = user_state[chat_id]
+                tuple_cursor.execute(
+                    "UPDATE users SET name=%s, email=%s, phone=%s, username=%s WHERE chat_id=%s RETURNING package",
+                    (state['name'], state['email'], state['phone'], telegram_username, chat_id)
                 )
-                conn.commit()
-
-                cursor.execute("SELECT package FROM users WHERE chat_id=%s", (chat_id,))
-                pkg = cursor.fetchone()["package"]
+                pkg = tuple_cursor.fetchone()[0]
                 keyboard = [[InlineKeyboardButton("Finalize Registration", callback_data=f"finalize_reg_{chat_id}")]]
                 await context.bot.send_message(
                     ADMIN_ID,
-                    f"🆕 User Details Received:\nUser ID: {chat_id}\nUsername: {telegram_username}\nPackage: {pkg}\nEmail: {user_state[chat_id]['email']}\nName: {user_state[chat_id]['name']}\nPhone: {user_state[chat_id]['phone']}\n\nPlease finalize registration by providing credentials.",
+                    f"🆕 User Details Received:\nUser ID: {chat_id}\nUsername: {telegram_username}\nPackage: {pkg}\nEmail: {state['email']}\nName: {state['name']}\nPhone: {state['phone']}\n\nPlease finalize registration by providing credentials.",
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
                 await update.message.reply_text(
                     "✅ Details received! Awaiting admin finalization.",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Main Menu", callback_data="menu")]])
+                    reply_markup=MAIN_MENU_MARKUP
                 )
                 del user_state[chat_id]
             except psycopg.Error as e:
-                logger.error(f"Database error in pending_details: {e}")
+                logger.error("Database error in pending_details: %s", e)
                 await update.message.reply_text("An error occurred. Please try again.")
 
         # Coupon quantity: now shows Standard and X options
@@ -1247,12 +1731,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 if quantity <= 0:
                     raise ValueError
                 user_state[chat_id]['coupon_quantity'] = quantity
-                keyboard = [
-                    [InlineKeyboardButton("Lite Package Coupons (₦10,000)", callback_data="coupon_standard")],
-                    [InlineKeyboardButton("Pro Package Coupons (₦15,000)", callback_data="coupon_x")],
-                    [InlineKeyboardButton("🔙 Main Menu", callback_data="menu")],
-                ]
-                await update.message.reply_text("Select the package for your coupons:", reply_markup=InlineKeyboardMarkup(keyboard))
+                await update.message.reply_text("Select the package for your coupons:", reply_markup=COUPON_PACKAGE_MARKUP)
                 # do not keep expecting after showing options
                 user_state[chat_id].pop('expecting', None)
             except ValueError:
@@ -1266,13 +1745,12 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Password recovery
         elif expecting == 'password_recovery':
-            cursor.execute("SELECT username, email, password FROM users WHERE email=%s AND chat_id=%s AND payment_status='registered'", (text, chat_id))
-            user = cursor.fetchone()
+            tuple_cursor.execute("SELECT username, email, password FROM users WHERE email=%s AND chat_id=%s AND payment_status='registered'", (text, chat_id))
+            user = tuple_cursor.fetchone()
             if user:
-                username, email, _ = user.values()
+                username, email, _ = user
                 new_password = secrets.token_urlsafe(8)
                 cursor.execute("UPDATE users SET password=%s WHERE chat_id=%s", (new_password, chat_id))
-                conn.commit()
                 await context.bot.send_message(
                     chat_id,
                     f"Your password has been reset.\nNew Password: {new_password}\nKeep it safe and use 'Password Recovery' if needed again."
@@ -1297,17 +1775,15 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Admin sending coupon codes after approval
         elif isinstance(expecting, dict) and expecting.get('type') == 'coupon_codes' and chat_id == ADMIN_ID:
             payment_id = expecting['payment_id']
-            codes = text.splitlines()
-            sent_codes = []
-            for code in codes:
-                code = code.strip()
-                if code:
-                    cursor.execute("INSERT INTO coupons (payment_id, code) VALUES (%s, %s)", (payment_id, code))
-                    sent_codes.append(code)
-            conn.commit()
-            cursor.execute("SELECT chat_id FROM payments WHERE id=%s", (payment_id,))
-            user_chat_row = cursor.fetchone()
-            user_chat_id = user_chat_row["chat_id"] if user_chat_row else None
+            sent_codes = [code.strip() for code in text.splitlines() if code.strip()]
+            # executemany pipelines the inserts: one round trip for the whole batch
+            cursor.executemany(
+                "INSERT INTO coupons (payment_id, code) VALUES (%s, %s)",
+                [(payment_id, code) for code in sent_codes]
+            )
+            tuple_cursor.execute("SELECT chat_id FROM payments WHERE id=%s", (payment_id,))
+            user_chat_row = tuple_cursor.fetchone()
+            user_chat_id = user_chat_row[0] if user_chat_row else None
             if user_chat_id:
                 await context.bot.send_message(
                     user_chat_id,
@@ -1324,27 +1800,32 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 return
             username, password = lines
             for_user = user_state[chat_id]['for_user']
-            cursor.execute(
-                "UPDATE users SET username=%s, password=%s, payment_status='registered', registration_date=%s WHERE chat_id=%s",
-                (username, password, datetime.datetime.now(), for_user)
-            )
-            conn.commit()
-            cursor.execute("SELECT package, referred_by FROM users WHERE chat_id=%s", (for_user,))
-            row = cursor.fetchone()
-            if row:
-                package, referred_by = row.values()
-                if referred_by:
-                    additional_reward = 0.4 if package == "Standard" else 0.9
-                    cursor.execute("UPDATE users SET balance = balance + %s WHERE chat_id=%s", (additional_reward, referred_by))
-                    conn.commit()
+            # Register the user, credit the referrer's package bonus and read back
+            # the details for the admin summary in one statement. Postgres applies
+            # only one update per row in a statement, so a self-referral is
+            # credited by reg itself and left out of bonus
+            tuple_cursor.execute("""
+                WITH reg AS (
+                    UPDATE users SET username=%s, password=%s, payment_status='registered', registration_date=%s,
+                        balance = balance + CASE WHEN referred_by IS DISTINCT FROM chat_id THEN 0
+                                                 WHEN package = 'Standard' THEN 0.4 ELSE 0.9 END
+                    WHERE chat_id=%s
+                    RETURNING chat_id, package, email, name, phone, referred_by
+                ),
+                bonus AS (
+                    UPDATE users SET balance = balance + CASE WHEN reg.package = 'Standard' THEN 0.4 ELSE 0.9 END
+                    FROM reg WHERE users.chat_id = reg.referred_by AND reg.referred_by <> reg.chat_id
+                )
+                SELECT package, email, name, phone FROM reg
+            """, (username, password, datetime.datetime.now(), for_user))
+            user_details = tuple_cursor.fetchone()
+            invalidate_status(for_user)
             await context.bot.send_message(
                 for_user,
                 f"🎉 Registration successful! Your username is\n {username}\n and password is\n {password}\n\n Join the group using the link below to access your Mentorship forum:\n {GROUP_LINK}"
             )
-            cursor.execute("SELECT package, email, name, phone FROM users WHERE chat_id=%s", (for_user,))
-            user_details = cursor.fetchone()
             if user_details:
-                pkg, email, full_name, phone = user_details.values()
+                pkg, email, full_name, phone = user_details
                 await context.bot.send_message(
                     ADMIN_ID,
                     f"New registration:\nUser ID: {for_user}\nUsername: {username}\nPackage: {pkg}\nEmail: {email}\nName: {full_name}\nPhone: {phone}"
@@ -1362,92 +1843,139 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Use the button below to engage in other processes",
                 reply_markup=ReplyKeyboardMarkup(reply_keyboard, resize_keyboard=True)
             )
+            reply_keyboard_shown.pop(for_user)
             del user_state[chat_id]
 
         # Admin sending broadcast message
         elif expecting == 'broadcast_message' and chat_id == ADMIN_ID:
             message_to_send = text
-            cursor.execute("SELECT chat_id FROM users WHERE payment_status IS NOT NULL")
-            rows = cursor.fetchall()
+
+            async def send_one(user_id):
+                await send_bucket.acquire()
+                await context.bot.send_message(user_id, message_to_send)
+
             sent = 0
-            for r in rows:
-                try:
-                    await context.bot.send_message(r["chat_id"], message_to_send)
-                    sent += 1
-                except Exception:
-                    continue
+            # Server-side cursor: recipients arrive one batch at a time instead of all at once.
+            # WITH HOLD keeps it open across the autocommitted statements other handlers run meanwhile.
+            with conn.cursor(name="broadcast_recipients", row_factory=psycopg.rows.tuple_row, withhold=True) as recipients:
+                recipients.execute("SELECT chat_id FROM users WHERE payment_status IS NOT NULL")
+                while rows := recipients.fetchmany(BROADCAST_BATCH):
+                    results = await asyncio.gather(
+                        *(send_one(user_id) for (user_id,) in rows),
+                        return_exceptions=True
+                    )
+                    sent += sum(1 for result in results if not isinstance(result, Exception))
             await update.message.reply_text(f"Broadcast sent to {sent} users.")
             del user_state[chat_id]['expecting']
 
     except Exception as e:
-        logger.error(f"Error in handle_text: {e}")
+        logger.error("Error in handle_text: %s", e)
         await update.message.reply_text("An error occurred. Please try again or contact @bigscottmedia.")
 
 
 # Job functions
-async def check_registration_payment(context: ContextTypes.DEFAULT_TYPE):
-    chat_id = context.job.data['chat_id']
-    status = get_status(chat_id)
-    if status == 'pending_payment':
-        keyboard = [[InlineKeyboardButton("Payment Approval Stats", callback_data="check_approval")]]
-        await context.bot.send_message(chat_id, "Your payment is still being reviewed. Click below to check status:", reply_markup=InlineKeyboardMarkup(keyboard))
-    elif status == 'pending_details':
-        if 'expecting' not in user_state.get(chat_id, {}):
-            user_state[chat_id] = {'expecting': 'name'}
-            await context.bot.send_message(chat_id, "Please provide your full name:")
+async def clear_stale_user_state(context: ContextTypes.DEFAULT_TYPE):
+    user_state.evict_expired()
+    reply_keyboard_shown.evict_expired()
+    # Entries are only useful for seconds; drop them rather than let the dict grow
+    member_cache.clear()
+    # Expired status entries are ignored on read but would otherwise stay forever
+    cutoff = time.monotonic() - STATUS_CACHE_TTL
+    for chat_id in [chat_id for chat_id, (_, cached_at) in status_cache.items() if cached_at < cutoff]:
+        del status_cache[chat_id]
 
 
-async def check_coupon_payment(context: ContextTypes.DEFAULT_TYPE):
-    payment_id = context.job.data['payment_id']
+async def flush_interactions(context: ContextTypes.DEFAULT_TYPE):
+    write_interactions()
+
+
+async def follow_up_payments(context: ContextTypes.DEFAULT_TYPE):
+    # One sweep covers every screenshot that crossed the follow-up delay since the last run
+    window_end = datetime.datetime.now() - PAYMENT_FOLLOW_UP_DELAY
+    window_start = context.job.data.get('window_end') or window_end - datetime.timedelta(seconds=PAYMENT_SWEEP_INTERVAL)
     try:
-        cursor.execute("SELECT status, chat_id FROM payments WHERE id=%s", (payment_id,))
-        row = cursor.fetchone()
-        if row and row["status"] == 'pending_payment':
-            chat_id = row["chat_id"]
-            keyboard = [[InlineKeyboardButton("Payment Approval Stats", callback_data="check_approval")]]
-            await context.bot.send_message(chat_id, "Your coupon payment is still being reviewed. Click below to check status:", reply_markup=InlineKeyboardMarkup(keyboard))
+        tuple_cursor.execute(
+            "SELECT chat_id, payment_status FROM users WHERE screenshot_uploaded_at > %s AND screenshot_uploaded_at <= %s",
+            (window_start, window_end)
+        )
+        registrations = tuple_cursor.fetchall()
+        tuple_cursor.execute(
+            "SELECT chat_id FROM payments WHERE screenshot_uploaded_at > %s AND screenshot_uploaded_at <= %s AND status = 'pending_payment'",
+            (window_start, window_end)
+        )
+        coupons = tuple_cursor.fetchall()
     except psycopg.Error as e:
-        logger.error(f"Database error in check_coupon_payment: {e}")
+        logger.error("Database error in follow_up_payments: %s", e)
+        return
+    context.job.data['window_end'] = window_end
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Payment Approval Stats", callback_data="check_approval")]])
+    for chat_id, status in registrations:
+        try:
+            if status == 'pending_payment':
+                await context.bot.send_message(chat_id, "Your payment is still being reviewed. Click below to check status:", reply_markup=keyboard)
+            elif status == 'pending_details':
+                if 'expecting' not in user_state.get(chat_id, {}):
+                    user_state[chat_id] = {'expecting': 'name'}
+                    await context.bot.send_message(chat_id, "Please provide your full name:")
+        except Exception as e:
+            logger.error("Failed to send registration follow-up to %s: %s", chat_id, e)
+    for (chat_id,) in coupons:
+        try:
+            await context.bot.send_message(chat_id, "Your coupon payment is still being reviewed. Click below to check status:", reply_markup=keyboard)
+        except Exception as e:
+            logger.error("Failed to send coupon follow-up to %s: %s", chat_id, e)
 
 
 async def daily_reminder(context: ContextTypes.DEFAULT_TYPE):
     try:
-        cursor.execute("SELECT chat_id FROM users WHERE alarm_setting=1")
-        user_ids = [row["chat_id"] for row in cursor.fetchall()]
-        for user_id in user_ids:
+        tuple_cursor.execute("SELECT chat_id FROM users WHERE alarm_setting=1")
+        user_ids = [chat_id for (chat_id,) in tuple_cursor.fetchall()]
+    except psycopg.Error as e:
+        logger.error("Database error in daily_reminder: %s", e)
+        return
+    # Overlap the Bot API round trips instead of sending one reminder at a time,
+    # paced by the shared bucket so reminders and broadcasts stay under the flood limit
+    semaphore = asyncio.Semaphore(32)
+
+    async def send_reminder(user_id):
+        async with semaphore:
+            await send_bucket.acquire()
             try:
                 await context.bot.send_message(user_id, "🌟 Daily Reminder: Complete your Tapify tasks to maximize your earnings!")
                 log_interaction(user_id, "daily_reminder")
             except Exception as e:
-                logger.error(f"Failed to send reminder to {user_id}: {e}")
-    except psycopg.Error as e:
-        logger.error(f"Database error in daily_reminder: {e}")
+                logger.error("Failed to send reminder to %s: %s", user_id, e)
+
+    await asyncio.gather(*(send_reminder(user_id) for user_id in user_ids))
+
+
+async def daily_jobs(context: ContextTypes.DEFAULT_TYPE):
+    # The admin summary's query and send overlap the reminder fan-out
+    await asyncio.gather(daily_reminder(context), daily_summary(context))
 
 
 async def daily_summary(context: ContextTypes.DEFAULT_TYPE):
     now = datetime.datetime.now()
     start_time = now - datetime.timedelta(days=1)
     try:
-        cursor.execute("SELECT COUNT(*) FROM users WHERE registration_date >= %s", (start_time,))
-        new_users = cursor.fetchone()["count"]
-        cursor.execute("""
-            SELECT SUM(CASE package WHEN 'Standard' THEN 10000 WHEN 'X' THEN 15000 ELSE 0 END)
-            FROM users
-            WHERE approved_at >= %s AND payment_status = 'registered'
-        """, (start_time,))
-        reg_payments = cursor.fetchone()["sum"] or 0
-        cursor.execute("SELECT SUM(total_amount) FROM payments WHERE approved_at >= %s AND status = 'approved'", (start_time,))
-        coupon_payments = cursor.fetchone()["sum"] or 0
-        total_payments = reg_payments + coupon_payments
-        cursor.execute("SELECT COUNT(*) FROM user_tasks WHERE completed_at >= %s", (start_time,))
-        tasks_completed = cursor.fetchone()["count"]
-        cursor.execute("""
-            SELECT SUM(t.reward)
-            FROM user_tasks ut
-            JOIN tasks t ON ut.task_id = t.id
-            WHERE ut.completed_at >= %s
-        """, (start_time,))
-        total_distributed = cursor.fetchone()["sum"] or 0
+        # All five aggregates in one round trip; package prices come from PACKAGE_PRICES
+        tuple_cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM users WHERE registration_date >= %(since)s),
+                (SELECT SUM(p.price)
+                 FROM users u
+                 JOIN unnest(%(packages)s::text[], %(prices)s::int[]) AS p(package, price) ON p.package = u.package
+                 WHERE u.approved_at >= %(since)s AND u.payment_status = 'registered'),
+                (SELECT SUM(total_amount) FROM payments WHERE approved_at >= %(since)s AND status = 'approved'),
+                (SELECT COUNT(*) FROM user_tasks WHERE completed_at >= %(since)s),
+                (SELECT SUM(t.reward)
+                 FROM user_tasks ut
+                 JOIN tasks t ON ut.task_id = t.id
+                 WHERE ut.completed_at >= %(since)s)
+        """, {"since": start_time, "packages": list(PACKAGE_PRICES), "prices": list(PACKAGE_PRICES.values())})
+        new_users, reg_payments, coupon_payments, tasks_completed, total_distributed = tuple_cursor.fetchone()
+        total_payments = (reg_payments or 0) + (coupon_payments or 0)
+        total_distributed = total_distributed or 0
         text = (
             f"📊 Daily Summary ({now.strftime('%Y-%m-%d')}):\n\n"
             f"• New Users: {new_users}\n"
@@ -1457,79 +1985,61 @@ async def daily_summary(context: ContextTypes.DEFAULT_TYPE):
         )
         await context.bot.send_message(ADMIN_ID, text)
     except psycopg.Error as e:
-        logger.error(f"Database error in daily_summary: {e}")
+        logger.error("Database error in daily_summary: %s", e)
         await context.bot.send_message(ADMIN_ID, "Error generating daily summary.")
 
 
 # Menus
 async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Handles both callback_query and message commands
-    if update.callback_query:
-        chat_id = update.callback_query.from_user.id
+    # Handles both callback_query and message commands: edit the menu in place
+    # for button presses, reply with it for /menu
+    query = update.callback_query
+    chat_id = query.from_user.id if query else update.effective_chat.id
+    status, package = get_user_brief(chat_id)
+    registered = status == 'registered'
+    if registered:
+        keyboard = MEMBER_X_MENU_MARKUP if package == "X" else MEMBER_MENU_MARKUP
     else:
-        chat_id = update.effective_chat.id
-    try:
-        cursor.execute("SELECT payment_status, package FROM users WHERE chat_id=%s", (chat_id,))
-        user = cursor.fetchone()
-        # default keyboard for non-registered users
-        keyboard = [
-            [InlineKeyboardButton("How It Works", callback_data="how_it_works")],
-            [InlineKeyboardButton("Purchase Coupon Code", callback_data="coupon")],
-            [InlineKeyboardButton("💸 Get Registered Now", callback_data="package_selector")],
-            [InlineKeyboardButton("🚀 Upgrade To Tapify Pro", callback_data="package_selector")],  # upgrade quick button
-            [InlineKeyboardButton("❓ Help", callback_data="help")],
-        ]
-        if user and user["payment_status"] == 'registered':
-            keyboard = [
-                [InlineKeyboardButton("📊 My Stats", callback_data="stats")],
-                [InlineKeyboardButton("Do Daily Tasks", callback_data="daily_tasks")],
-                [InlineKeyboardButton("💰 Earn Extra for the Day", callback_data="earn_extra")],
-                [InlineKeyboardButton("Purchase Coupon", callback_data="coupon")],
-                [InlineKeyboardButton("❓ Help", callback_data="help")],
-            ]
-            if user["package"] == "X":
-                keyboard.insert(1, [InlineKeyboardButton("🚀 Boost with AI", callback_data="boost_ai")])
-        text = "Select an option below:"
-        reply_keyboard = [["/menu(🔙)"]]
-        if user and user["payment_status"] == 'registered':
-            reply_keyboard.append([KeyboardButton(text="Start Earning On Tapify", web_app=WebAppInfo(url=f"{WEBAPP_URL}?chat_id={chat_id}"))])
-        if update.callback_query:
-            await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            await context.bot.send_message(
-                chat_id,
-                "Use the buttons below to access Main Menu and Start Earning on Tapify too",
-                reply_markup=ReplyKeyboardMarkup(reply_keyboard, resize_keyboard=True)
-            )
-        else:
-            await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
-            await context.bot.send_message(
-                chat_id,
-                "Use the buttons below to access the Menu button or Login to your Tapify Account(Available if you're registered):",
-                reply_markup=ReplyKeyboardMarkup(reply_keyboard, resize_keyboard=True)
+        keyboard = GUEST_MENU_MARKUP
+    show_menu = query.edit_message_text if query else update.message.reply_text
+    await show_menu("Select an option below:", reply_markup=keyboard)
+    if reply_keyboard_shown.get(chat_id) != registered:
+        if registered:
+            reply_markup = ReplyKeyboardMarkup(
+                (MENU_REPLY_ROW, (KeyboardButton(text="Start Earning On Tapify", web_app=WebAppInfo(url=f"{WEBAPP_URL}?chat_id={chat_id}")),)),
+                resize_keyboard=True
             )
-        log_interaction(chat_id, "show_main_menu")
-    except psycopg.Error as e:
-        logger.error(f"Database error in show_main_menu: {e}")
-        if update.callback_query:
-            await update.callback_query.message.reply_text("An error occurred. Please try again.")
         else:
-            await update.message.reply_text("An error occurred. Please try again.")
+            reply_markup = GUEST_REPLY_MARKUP
+        reply_text = (
+            "Use the buttons below to access Main Menu and Start Earning on Tapify too" if query
+            else "Use the buttons below to access the Menu button or Login to your Tapify Account(Available if you're registered):"
+        )
+        await context.bot.send_message(chat_id, reply_text, reply_markup=reply_markup)
+        reply_keyboard_shown[chat_id] = registered
+    log_interaction(chat_id, "show_main_menu")
 
 
 async def help_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.callback_query.from_user.id
-    status = get_status(chat_id)
-    keyboard = [[InlineKeyboardButton(topic["label"], callback_data=key)] for key, topic in HELP_TOPICS.items()]
-    if status == 'registered':
-        keyboard.append([InlineKeyboardButton("👥 Refer a Friend", callback_data="refer_friend")])
-    keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="menu")])
-    await update.callback_query.edit_message_text("Help topics:", reply_markup=InlineKeyboardMarkup(keyboard))
+    markup = HELP_MENU_REGISTERED_MARKUP if get_status(chat_id) == 'registered' else HELP_MENU_MARKUP
+    await update.callback_query.edit_message_text("Help topics:", reply_markup=markup)
 
 
 # Bot startup and handler registration
-def main():
-    keep_alive()
-    application = Application.builder().token(BOT_TOKEN).build()
+async def main_async():
+    # HTTP/2 lets concurrent Bot API calls (broadcasts, reminders, admin
+    # notifications) multiplex over one TLS connection instead of queueing.
+    # getUpdates stays on the default HTTP/1.1: long polling over HTTP/2 is
+    # not reliable in PTB.
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .http_version("2")
+        # Handle different chats in parallel; see PerChatUpdateProcessor
+        .concurrent_updates(PerChatUpdateProcessor(256))
+        .build()
+    )
 
     # Commands
     application.add_handler(CommandHandler("start", start))
@@ -1549,12 +2059,43 @@ def main():
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
     # Jobs: simple repeating schedule; adjust times as necessary
-    # run reminders every 24 hours (first run after 10 seconds), summary every 24 hours (first after 20 seconds)
-    application.job_queue.run_repeating(daily_reminder, interval=86400, first=10)
-    application.job_queue.run_repeating(daily_summary, interval=86400, first=20)
+    # run reminders and the admin summary together every 24 hours (first run after 10 seconds)
+    application.job_queue.run_repeating(daily_jobs, interval=86400, first=10)
+    # flush buffered interaction logs every few seconds
+    application.job_queue.run_repeating(flush_interactions, interval=5, first=5)
+    application.job_queue.run_repeating(clear_stale_user_state, interval=3600, first=3600)
+    # remind users whose payment screenshot has been waiting an hour
+    application.job_queue.run_repeating(follow_up_payments, interval=PAYMENT_SWEEP_INTERVAL, first=PAYMENT_SWEEP_INTERVAL, data={})
+
+    # Start the bot (polling) alongside the keep-alive server. SIGINT/SIGTERM
+    # only ask the server to exit; the bot is then stopped and the buffered
+    # interaction rows flushed before the process ends.
+    server = keep_alive_server()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, server.handle_exit, sig, None)
+        except NotImplementedError:  # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+    async with application:
+        await application.start()
+        await application.updater.start_polling()
+        try:
+            await server.serve()
+        finally:
+            try:
+                await application.updater.stop()
+                await application.stop()
+            finally:
+                write_interactions()
 
-    # Start the bot (polling)
-    application.run_polling()
+
+def main():
+    # libuv-based loop for the bot, the keep-alive server and all Bot API I/O
+    if uvloop is not None:
+        uvloop.run(main_async())
+    else:
+        asyncio.run(main_async())
 
 
 if __name__ == "__main__":